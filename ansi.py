@@ -0,0 +1,66 @@
+import curses
+
+CLEAR_SCREEN = '\x1b[2J'
+HIDE_CURSOR = '\x1b[?25l'
+SHOW_CURSOR = '\x1b[?25h'
+RESET_ATTRS = '\x1b[0m'
+
+# curses attribute -> SGR parameter
+SGR_PARAMETERS = (
+    (curses.A_BOLD, '1'),
+    (curses.A_DIM, '2'),
+    (curses.A_UNDERLINE, '4'),
+    (curses.A_REVERSE, '7'),
+)
+
+
+def get_sgr(attr):
+    """Return escape sequence switching terminal to curses attributes."""
+
+    parameters = ['0'] + [parameter for flag, parameter in SGR_PARAMETERS if attr & flag]
+    return f'\x1b[{";".join(parameters)}m'
+
+
+def get_border_runs(rows, columns):
+    """Return runs drawing the screen border with a line above the footer, like `main.create_windows` does."""
+
+    line = '+' + '-' * (columns - 2) + '+'
+    runs = [(0, 0, line, 0), (rows - 3, 0, line, 0)]
+    for row in range(1, rows - 1):
+        if row != rows - 3:
+            runs.append((row, 0, '|', 0))
+            runs.append((row, columns - 1, '|', 0))
+    # the lower right corner is left out, writing there scrolls some terminals
+    runs.append((rows - 1, 0, line[:-1], 0))
+    return runs
+
+
+class AnsiEncoder:
+    """Encodes renderer runs (row, column, text, attr) to ANSI escape sequences for a remote terminal.
+
+    Cursor position and attributes of the terminal are tracked, so cursor moves and attribute switches
+    are sent only when they change. Call `reset` after the screen was cleared.
+    """
+
+    def __init__(self):
+        self._attr = None
+        self._cursor = None
+
+    def reset(self):
+        self._attr = None
+        self._cursor = None
+
+    def encode(self, runs, begin_row=0, begin_column=0):
+        """Return text drawing the runs of a window, which starts at begin_row, begin_column of the screen."""
+
+        chunks = []
+        for row, column, text, attr in runs:
+            row, column = row + begin_row, column + begin_column
+            if self._cursor != (row, column):
+                chunks.append(f'\x1b[{row + 1};{column + 1}H')
+            if self._attr != attr:
+                chunks.append(get_sgr(attr))
+                self._attr = attr
+            chunks.append(text)
+            self._cursor = row, column + len(text)
+        return ''.join(chunks)
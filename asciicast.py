@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from ansi import AnsiEncoder, CLEAR_SCREEN, get_border_runs, HIDE_CURSOR, RESET_ATTRS
+
+# time the game loop may spend on recording a tick, checked by benchmarks.py
+TICK_OVERHEAD_BUDGET = 10e-6
+# how often the writer thread wakes up to encode and write queued frames
+WRITE_INTERVAL = 0.5
+FILE_BUFFER_SIZE = 256 * 1024
+
+OUTPUT, RESIZE = 'o', 'r'
+
+
+def get_screen_layout(windows):
+    """Return size of the screen holding the windows inside a border, and offsets (begin_row, begin_column) of them."""
+
+    offsets = [window.getbegyx() for window in windows]
+    rows = max(begin_row + window.getmaxyx()[0] for window, (begin_row, _) in zip(windows, offsets)) + 1
+    columns = max(begin_column + window.getmaxyx()[1] for window, (_, begin_column) in zip(windows, offsets)) + 1
+    return (rows, columns), offsets
+
+
+class AsciicastRecorder:
+    """Records the screen to asciicast v2 file, which can be played with `asciinema play FILE`.
+
+    The game loop passes runs changed by renderers to `record`, which only appends them to a queue.
+    A background thread encodes queued frames to ANSI text and writes them to a buffered file,
+    so the game loop never waits for the disk. windows are game and footer windows, runs passed to `record`
+    are in the same order. Times are game seconds, so recordings of headless runs play at the game speed.
+    """
+
+    def __init__(self, path, windows, title=None):
+        (rows, columns), offsets = get_screen_layout(windows)
+        self._file = open(path, 'w', encoding='utf-8', buffering=FILE_BUFFER_SIZE)
+        header = {
+            'version': 2,
+            'width': columns,
+            'height': rows,
+            'timestamp': int(time.time()),
+            'env': {'TERM': os.environ.get('TERM', 'xterm')},
+        }
+        if title:
+            header['title'] = title
+        self._file.write(json.dumps(header) + '\n')
+
+        self.frames = 0
+        # (seconds, kind, runs or layout) appended by the game loop and popped by the writer thread
+        self._queue = deque([(0.0, RESIZE, ((rows, columns), offsets))])
+        self._encoder = AnsiEncoder()
+        self._offsets = offsets
+        self._size = rows, columns
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='asciicast-writer', daemon=True)
+        self._thread.start()
+
+    def record(self, seconds, runs):
+        """Queue runs of a rendered frame, one list of (row, column, text, attr) per window."""
+
+        self._queue.append((seconds, OUTPUT, runs))
+        self.frames += 1
+
+    def resize(self, seconds, windows):
+        """Queue switch to windows of the new screen size, the screen is cleared and the border is drawn again."""
+
+        self._queue.append((seconds, RESIZE, get_screen_layout(windows)))
+
+    def close(self):
+        """Write everything queued and close the file."""
+
+        self._closed.set()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        while not self._closed.wait(WRITE_INTERVAL):
+            self._write_queued()
+        self._write_queued()
+
+    def _write_queued(self):
+        queue, write, encode = self._queue, self._file.write, self._encoder.encode
+        while queue:
+            seconds, kind, data = queue.popleft()
+            if kind == RESIZE:
+                size, self._offsets = data
+                if size != self._size:
+                    self._size = size
+                    rows, columns = size
+                    write(json.dumps([round(seconds, 6), RESIZE, f'{columns}x{rows}']) + '\n')
+                self._encoder.reset()
+                output = HIDE_CURSOR + RESET_ATTRS + CLEAR_SCREEN + encode(get_border_runs(*self._size))
+            else:
+                output = ''.join(encode(runs, *offset) for offset, runs in zip(self._offsets, data))
+            if output:
+                write(json.dumps([round(seconds, 6), OUTPUT, output]) + '\n')
+        self._file.flush()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import zlib
+from collections import namedtuple
+
+from curses_tools import get_sprite
+
+FRAMES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frames')
+
+# mask is occupancy bitmask of the sprite used for collisions, see curses_tools.Sprite
+Frame = namedtuple('Frame', ['name', 'text', 'rows', 'columns', 'sprite', 'mask'])
+
+_frames = {}
+
+
+def _create_frame(name, text):
+    sprite = get_sprite(text)
+    return Frame(name, text, sprite.rows, sprite.columns, sprite, sprite.mask)
+
+
+def _read_frames_dir(frames_dir):
+    texts = {}
+    for group in sorted(os.listdir(frames_dir)):
+        group_dir = os.path.join(frames_dir, group)
+        if not os.path.isdir(group_dir):
+            continue
+        texts[group] = {}
+        for filename in sorted(os.listdir(group_dir)):
+            with open(os.path.join(group_dir, filename), 'r') as frame:
+                texts[group][os.path.splitext(filename)[0]] = frame.read()
+    return texts
+
+
+def _read_bundle(bundle_path):
+    with open(bundle_path, 'rb') as bundle:
+        return json.loads(zlib.decompress(bundle.read()).decode('utf-8'))
+
+
+def load_assets(bundle_path=None, frames_dir=FRAMES_DIR):
+    """Load all frames into memory, either from frames directory or from packed bundle file."""
+
+    texts = _read_bundle(bundle_path) if bundle_path else _read_frames_dir(frames_dir)
+
+    _frames.clear()
+    for group, group_texts in texts.items():
+        _frames[group] = [_create_frame(name, text) for name, text in sorted(group_texts.items())]
+
+
+def pack_assets(bundle_path, frames_dir=FRAMES_DIR):
+    """Pack all frames into single compressed file, which can be passed to load_assets later."""
+
+    data = json.dumps(_read_frames_dir(frames_dir)).encode('utf-8')
+    with open(bundle_path, 'wb') as bundle:
+        bundle.write(zlib.compress(data, 9))
+
+
+def get_frames(group):
+    """Return list of frames of the group (directory in frames/), sorted by name."""
+
+    if not _frames:
+        load_assets()
+    return _frames[group]
+
+
+def get_frame(group, name):
+    for frame in get_frames(group):
+        if frame.name == name:
+            return frame
+    raise KeyError(f'No frame {name} in {group}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack game frames into single bundle file')
+    parser.add_argument('bundle', help='Path to the bundle file to create')
+    args = parser.parse_args()
+    pack_assets(args.bundle)
@@ -0,0 +1,423 @@
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+import timeit
+import tracemalloc
+
+import curses_tools
+from asciicast import AsciicastRecorder, TICK_OVERHEAD_BUDGET
+from assets import get_frame, get_frames, load_assets
+from curses_tools import draw_frame
+from entities import EntityStore, GARBAGE, PROJECTILE
+from game import Game, get_collided_obstacle
+from game_scenario import load_scenario, Scenario
+from headless import create_screen, FakeCanvas, ScriptedControls
+from main import TIC_TIMEOUT
+from obstacles import has_collision, has_mask_collision, has_swept_collision, Obstacle, ObstaclesGrid
+from physics import update_speed
+from renderer import Renderer
+from scheduler import TickClock
+from spectator import SpectatorFeed
+from server import Session
+
+SCREEN_SIZE = 40, 120
+# games don't wait for the next tick, they run as fast as they can
+CLOCK = TickClock(TIC_TIMEOUT, realtime=False)
+
+# stars, garbage, shots kept on the screen during scenario benchmarks
+SCENARIO_DENSITIES = [
+    (100, 5, 5),
+    (1000, 30, 50),
+    (10000, 100, 300),
+]
+SCENARIO_TICKS = 100
+SCENARIO_EVENTS = 10000
+SESSIONS = 100
+SESSION_TICKS = 50
+
+# relative slowdown reported as regression by --compare
+REGRESSION_THRESHOLD = 0.1
+
+_benchmarks = []
+# benchmark name -> seconds it must not exceed
+_budgets = {}
+# checks that optimized code gives the same results as the plain one, they return messages about mismatches
+_checks = []
+
+
+def benchmark(function):
+    _benchmarks.append(function)
+    return function
+
+
+def check(function):
+    _checks.append(function)
+    return function
+
+
+def measure(function, repeat=5):
+    """Return best time of a single function call in seconds."""
+
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def _fill_obstacles(count, rows, columns, rng):
+    obstacles = ObstaclesGrid()
+    for _ in range(count):
+        obstacles.add(Obstacle(rng.uniform(0, rows), rng.randint(0, columns), rng.randint(1, 9), rng.randint(1, 25)))
+    return obstacles
+
+
+@benchmark
+def bench_draw_frame():
+    canvas = FakeCanvas(*SCREEN_SIZE)
+    results = {}
+    for group in ('rocket', 'garbage', 'game_over'):
+        for frame in get_frames(group):
+            results[f'draw_frame[{frame.name}]'] = measure(lambda: draw_frame(canvas, 10, 10, frame.text))
+    return results
+
+
+@benchmark
+def bench_has_collision():
+    return {
+        'has_collision[hit]': measure(lambda: has_collision((10, 10), (5, 20), (12, 15))),
+        'has_collision[miss]': measure(lambda: has_collision((10, 10), (5, 20), (30, 70))),
+    }
+
+
+@benchmark
+def bench_has_swept_collision():
+    return {
+        'has_swept_collision[hit]': measure(lambda: has_swept_collision((10, 10), (1, 20), (12, 15), (9, 15))),
+        'has_swept_collision[miss]': measure(lambda: has_swept_collision((10, 10), (1, 20), (32, 70), (30, 70))),
+    }
+
+
+@check
+def check_swept_collision(trials=100000):
+    """Swept collision never misses a collision at the end of the path, and a fast shot doesn't tunnel."""
+
+    rng = random.Random(0)
+    mismatches = []
+    frames = get_frames('garbage')
+    for _ in range(trials):
+        frame = rng.choice(frames)
+        # garbage moves by half a row per tick
+        obstacle = Obstacle(rng.randint(0, 40) / 2, rng.randint(0, 20), frame.rows, frame.columns, mask=frame.mask)
+        obstacle.previous_row = obstacle.row - 0.5
+        end = rng.randint(-2, 35), rng.randint(-2, 45)
+        start = end[0] + rng.randint(-6, 6), end[1] + rng.randint(-6, 6)
+        obj_size = rng.randint(1, 3), rng.randint(1, 3)
+        corner, size = (obstacle.row, obstacle.column), (obstacle.rows_size, obstacle.columns_size)
+        if has_collision(corner, size, end, obj_size) and not has_swept_collision(corner, size, start, end, obj_size):
+            mismatches.append(f'has_swept_collision misses a box at the end of path {start} -> {end} '
+                              f'of {obj_size} object, box {corner} of {size}')
+        if obstacle.has_collision(*end) and not obstacle.has_swept_collision(*start, *end):
+            mismatches.append(f'Obstacle.has_swept_collision misses {frame.name} at the end of path {start} -> {end}, '
+                              f'obstacle at {corner}')
+
+    # a plasma shot is faster than trash_small is high, it used to fly through it between ticks
+    entities = EntityStore(ObstaclesGrid())
+    canvas = FakeCanvas(*SCREEN_SIZE)
+    slot = entities.spawn_garbage(10, get_frame('garbage', 'trash_small'))
+    entities.rows[slot] = 10
+    entities.spawn_projectile(15, 13, rows_speed=-8)
+    destroyed = []
+    while len(entities):
+        destroyed.extend(entities.step(canvas))
+        if destroyed:
+            break
+        canvas.cells.clear()
+    if not destroyed:
+        mismatches.append('Fast shot flies through trash_small')
+    return mismatches
+
+
+@benchmark
+def bench_has_mask_collision():
+    hubble = get_frame('garbage', 'hubble')
+    rocket = get_frames('rocket')[0]
+    corner, size = (10, 10), (hubble.rows, hubble.columns)
+    return {
+        'has_mask_collision[shot]': measure(lambda: has_mask_collision(corner, size, hubble.mask, (13, 15))),
+        'has_mask_collision[rocket]': measure(lambda: has_mask_collision(corner, size, hubble.mask, (12, 20),
+                                                                         (rocket.rows, rocket.columns), rocket.mask)),
+    }
+
+
+@benchmark
+def bench_update_speed():
+    return {
+        'update_speed[accelerate]': measure(lambda: update_speed(0.5, -0.5, 1, -1)),
+        'update_speed[fade]': measure(lambda: update_speed(0.5, -0.5, 0, 0)),
+    }
+
+
+@benchmark
+def bench_get_collided_obstacle():
+    rng = random.Random(0)
+    rows, columns = SCREEN_SIZE
+    points = [(rng.randint(0, rows), rng.randint(0, columns)) for _ in range(100)]
+    results = {}
+    for count in (10, 100, 1000):
+        obstacles = _fill_obstacles(count, rows, columns, rng)
+
+        def lookup_points():
+            for row, column in points:
+                get_collided_obstacle(obstacles, row, column)
+
+        results[f'get_collided_obstacle[{count}]'] = measure(lookup_points) / len(points)
+    return results
+
+
+@benchmark
+def bench_scenario_timeline(events_number=SCENARIO_EVENTS):
+    scenario = load_scenario()
+    events = [{'year': 1957 + index / 100, 'phrase': f'Event {index}'} for index in range(events_number)]
+    return {
+        'garbage_delay_tics': measure(lambda: scenario.get_garbage_delay_tics(2000)),
+        f'scenario_compile[{events_number}]': measure(lambda: Scenario(1957, events, []).compile(10)),
+    }
+
+
+def run_scenario(stars, garbage, shots, ticks=SCENARIO_TICKS, seed=0, recorder=None):
+    """Run the game keeping the given numbers of stars, garbage and shots, return durations of ticks.
+
+    recorder is AsciicastRecorder to record rendered runs to.
+    """
+
+    rng = random.Random(seed)
+    canvas_window, sub_window = create_screen(*SCREEN_SIZE)
+    renderers = Renderer(canvas_window), Renderer(sub_window)
+    game = Game(renderers[0].foreground, renderers[1].foreground, ScriptedControls([(0, 0, False)]), CLOCK, stars,
+                seed, immortal=True)
+
+    rows, columns = canvas_window.getmaxyx()
+    garbage_frames = get_frames('garbage')
+    durations = []
+    for _ in range(ticks):
+        entities = game.entities
+        for _ in range(garbage - entities.count(GARBAGE)):
+            slot = entities.spawn_garbage(rng.randint(0, columns - 10), rng.choice(garbage_frames))
+            entities.rows[slot] = rng.randint(0, rows // 2)
+        for _ in range(shots - entities.count(PROJECTILE)):
+            entities.spawn_projectile(rng.randint(rows // 2, rows - 2), rng.randint(1, columns - 2), rows_speed=-1)
+
+        started_at = time.perf_counter()
+        game.scheduler.run_tick()
+        runs = [renderer.flush() for renderer in renderers]
+        if recorder:
+            recorder.record(game.scheduler.tick * CLOCK.tick_timeout, runs)
+        durations.append(time.perf_counter() - started_at)
+
+    game.scheduler.close()
+    return durations
+
+
+@benchmark
+def bench_scenarios():
+    results = {}
+    for stars, garbage, shots in SCENARIO_DENSITIES:
+        durations = sorted(run_scenario(stars, garbage, shots))
+        name = f'tick[stars={stars},garbage={garbage},shots={shots}]'
+        results[name] = statistics.mean(durations)
+        results[name + '.p99'] = durations[int(len(durations) * 0.99) - 1]
+    return results
+
+
+class NullWriter:
+    """Stream writer of a client, which reads everything at once."""
+
+    def __init__(self):
+        self.transport = self
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+@benchmark
+def bench_sessions(sessions_num=SESSIONS, ticks=SESSION_TICKS):
+    """Tick many server sessions, report CPU time of a session tick and memory held by a session."""
+
+    tracemalloc.start()
+    base_memory, _ = tracemalloc.get_traced_memory()
+    sessions = [Session(NullWriter(), (24, 80), CLOCK, seed=seed) for seed in range(sessions_num)]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations = []
+    for _ in range(ticks):
+        started_at = time.perf_counter()
+        for session in sessions:
+            session.tick()
+        durations.append((time.perf_counter() - started_at) / sessions_num)
+    for session in sessions:
+        session.close()
+    return {
+        f'session_tick[{sessions_num}]': statistics.mean(durations),
+        f'session_memory[{sessions_num}].bytes': (memory - base_memory) / sessions_num,
+    }
+
+
+def format_value(name, value):
+    if name.endswith('.bytes'):
+        return f'{value / 1024:12.2f}KB'
+    return f'{value * 1e6:12.2f}us'
+
+
+SPECTATORS = 3
+
+
+def _read_spectator_feed(port):
+    with socket.create_connection(('127.0.0.1', port)) as connection:
+        while connection.recv(65536):
+            pass
+
+
+def _run_recorded_scenario(recorder, name, label, stars, garbage, shots):
+    """Run scenario with the recorder, return mean time the game loop spent on recording and mean tick time."""
+
+    record = recorder.record
+    record_durations = []
+
+    def record_timed(seconds, runs):
+        started_at = time.perf_counter()
+        record(seconds, runs)
+        record_durations.append(time.perf_counter() - started_at)
+
+    recorder.record = record_timed
+    try:
+        durations = run_scenario(stars, garbage, shots, recorder=recorder)
+    finally:
+        recorder.close()
+
+    density = f'stars={stars},garbage={garbage},shots={shots}'
+    _budgets[f'{name}_tick[{density}]'] = TICK_OVERHEAD_BUDGET
+    return {
+        f'{name}_tick[{density}]': statistics.mean(record_durations),
+        f'tick[{density},{label}]': statistics.mean(durations),
+    }
+
+
+@benchmark
+def bench_record():
+    """Game loop time spent on recording the screen and streaming it to spectators.
+
+    Encoding and writing on background threads is not counted.
+    """
+
+    stars, garbage, shots = SCENARIO_DENSITIES[1]
+    windows = create_screen(*SCREEN_SIZE)
+    results = _run_recorded_scenario(AsciicastRecorder(os.devnull, windows), 'record', 'recorded', stars, garbage,
+                                     shots)
+
+    feed = SpectatorFeed(windows, port=0)
+    for _ in range(SPECTATORS):
+        threading.Thread(target=_read_spectator_feed, args=(feed.port,), daemon=True).start()
+    results.update(_run_recorded_scenario(feed, 'spectate', 'spectated', stars, garbage, shots))
+    return results
+
+
+def check_budgets(results, budgets=None):
+    """Print results over their budgets, return their names."""
+
+    over_budget = []
+    for name, budget in (budgets or _budgets).items():
+        if name in results and results[name] > budget:
+            print(f'{name:60} {format_value(name, results[name])} is over budget {format_value(name, budget)}')
+            over_budget.append(name)
+    return over_budget
+
+
+def run_checks(name_filter=None):
+    """Run checks, return messages about mismatches."""
+
+    curses_tools.sound_enabled = False
+    mismatches = []
+    for function in _checks:
+        if name_filter and name_filter not in function.__name__:
+            continue
+        mismatches.extend(function())
+    return mismatches
+
+
+def run_benchmarks(name_filter=None):
+    curses_tools.sound_enabled = False
+
+    results = {}
+    for function in _benchmarks:
+        if name_filter and name_filter not in function.__name__:
+            continue
+        results.update(function())
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print changes against baseline results, return names of benchmarks which became slower."""
+
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        change = seconds / baseline[name] - 1
+        mark = ''
+        if change > threshold:
+            mark = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:60} {format_value(name, baseline[name])} -> {format_value(name, seconds)} {change:+8.1%}{mark}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run game benchmarks, results are in seconds per call or per tick, '
+                                                 'or in bytes for names ending with .bytes')
+    parser.add_argument('-o', '--output', default=None, help='Save results to JSON file')
+    parser.add_argument('-c', '--compare', default=None, help='Compare results with JSON file of a previous run')
+    parser.add_argument('-k', '--filter', default=None, help='Run benchmarks with the substring in the name only')
+    args = parser.parse_args()
+
+    load_assets()
+    mismatches = run_checks(args.filter)
+    for mismatch in mismatches[:10]:
+        print(f'MISMATCH {mismatch}')
+    if len(mismatches) > 10:
+        print(f'... and {len(mismatches) - 10} more mismatches')
+    results = run_benchmarks(args.filter)
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline)
+    else:
+        regressions = []
+        for name, seconds in results.items():
+            print(f'{name:60} {format_value(name, seconds)}')
+
+    regressions += check_budgets(results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, file, indent=2)
+
+    sys.exit(1 if regressions or mismatches else 0)
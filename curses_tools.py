@@ -1,23 +1,30 @@
+import curses
+from functools import lru_cache
+
 SPACE_KEY_CODE = 32
 LEFT_KEY_CODE = 260
 RIGHT_KEY_CODE = 261
 UP_KEY_CODE = 259
 DOWN_KEY_CODE = 258
 
+sound_enabled = True
+
 
 def read_controls(canvas):
     """Read keys pressed and returns tuple witl controls state."""
-    
-    rows_direction = columns_direction = 0
-    space_pressed = False
 
-    while True:
-        pressed_key_code = canvas.getch()
+    # getch returns -1 when there are no more keys pressed
+    # https://docs.python.org/3/library/curses.html#curses.window.getch
+    return get_controls(iter(canvas.getch, -1))
 
-        if pressed_key_code == -1:
-            # https://docs.python.org/3/library/curses.html#curses.window.getch
-            break
 
+def get_controls(key_codes):
+    """Return tuple with controls state for the key codes pressed."""
+
+    rows_direction = columns_direction = 0
+    space_pressed = False
+
+    for pressed_key_code in key_codes:
         if pressed_key_code == UP_KEY_CODE:
             rows_direction = -1
 
@@ -65,36 +72,80 @@ def read_controls(canvas):
 #     return rows_direction, columns_direction, space_pressed
 
 
-def draw_frame(canvas, start_row, start_column, text, negative=False):
-    """Draw multiline text fragment on canvas, erase text instead of drawing if negative=True is specified."""
-    
-    rows_number, columns_number = canvas.getmaxyx()
+class Sprite:
+    """Multiline text fragment compiled once for fast drawing.
 
-    for row, line in enumerate(text.splitlines(), round(start_row)):
-        if row < 0:
-            continue
+    Lines are split in advance and every line is stored as runs of non-space symbols
+    (row offset, column offset, string), so drawing takes one addstr per run instead of addch per symbol.
+    Mask is occupancy bitmask for collisions, one int per line, bit N is set when symbol N isn't a space.
+    """
 
-        if row >= rows_number:
-            break
+    def __init__(self, text):
+        self.text = text
+        self.lines = text.splitlines()
+        self.rows = len(self.lines)
+        self.columns = max((len(line) for line in self.lines), default=0)
+        self.runs = list(_get_runs(self.lines))
+        self.mask = tuple(_get_mask(line) for line in self.lines)
 
-        for column, symbol in enumerate(line, round(start_column)):
-            if column < 0:
-                continue
+    def draw(self, canvas, start_row, start_column, negative=False):
+        """Draw sprite on canvas, erase it instead of drawing if negative=True is specified."""
 
-            if column >= columns_number:
-                break
-                
-            if symbol == ' ':
+        rows_number, columns_number = canvas.getmaxyx()
+        start_row, start_column = round(start_row), round(start_column)
+
+        for row_offset, column_offset, run in self.runs:
+            row = start_row + row_offset
+            if row < 0:
                 continue
+            if row >= rows_number:
+                break
 
-            # Check that current position it is not in a lower right corner of the window
-            # Curses will raise exception in that case. Don`t ask why…
+            column = start_column + column_offset
+            first, last = 0, len(run)
+            if column < 0:
+                first = -column
+            if column + last > columns_number:
+                last = columns_number - column
+            # Curses will raise exception on writing to the lower right corner of the window
             # https://docs.python.org/3/library/curses.html#curses.window.addch
-            if row == rows_number - 1 and column == columns_number - 1:
+            if row == rows_number - 1 and column + last == columns_number:
+                last -= 1
+            if first >= last:
                 continue
 
-            symbol = symbol if not negative else ' '
-            canvas.addch(row, column, symbol)
+            text = run[first:last] if not negative else ' ' * (last - first)
+            canvas.addstr(row, column + first, text)
+
+
+def _get_runs(lines):
+    for row_offset, line in enumerate(lines):
+        column_offset = 0
+        for chunk in line.split(' '):
+            if chunk:
+                yield row_offset, column_offset, chunk
+            column_offset += len(chunk) + 1
+
+
+def _get_mask(line):
+    mask = 0
+    for column, symbol in enumerate(line):
+        if symbol != ' ':
+            mask |= 1 << column
+    return mask
+
+
+@lru_cache(maxsize=256)
+def get_sprite(text):
+    """Return compiled sprite for the text, sprites are cached by text."""
+
+    return Sprite(text)
+
+
+def draw_frame(canvas, start_row, start_column, text, negative=False):
+    """Draw multiline text fragment on canvas, erase text instead of drawing if negative=True is specified."""
+
+    get_sprite(text).draw(canvas, start_row, start_column, negative)
 
 
 def get_frame_size(text):
@@ -104,3 +155,10 @@ def get_frame_size(text):
     rows = len(lines)
     columns = max([len(line) for line in lines])
     return rows, columns
+
+
+def beep():
+    """Beep, unless sound is switched off (there is no terminal to beep in headless runs)."""
+
+    if sound_enabled:
+        curses.beep()
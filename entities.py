@@ -0,0 +1,250 @@
+import time
+from array import array
+from collections import defaultdict
+
+from curses_tools import beep
+from obstacles import Obstacle
+from pool import Pool
+
+GARBAGE = 1
+PROJECTILE = 2
+
+PROJECTILE_FLASH = '*O'
+
+
+class EntityStore:
+    """Garbage and projectiles kept in typed arrays, one slot per entity, advanced by a single step per tick.
+
+    Slots of destroyed entities are reused, obstacles of destroyed garbage are pooled. Every piece of garbage
+    is also registered in the obstacles grid with the mask of its frame, so the spaceship can collide with
+    its non-blank cells; projectiles are tested against obstacles in bulk, grouped by grid cell, along the whole
+    path they made during the tick, so fast projectiles don't tunnel through thin garbage. Hits marked in the grid
+    are drained by the step and the garbage hit is destroyed. Entities spawned during a tick appear on the next one.
+    """
+
+    def __init__(self, obstacles):
+        self.obstacles = obstacles
+
+        self.kinds = array('b')
+        self.alive = array('b')
+        self.ages = array('L')
+        self.rows = array('d')
+        self.columns = array('d')
+        self.row_speeds = array('d')
+        self.column_speeds = array('d')
+        self.rows_size = array('H')
+        self.columns_size = array('H')
+        self.frame_ids = array('H')
+
+        self.frames = []
+        self.obstacle_pool = Pool(Obstacle)
+        self.reused_slots = 0
+        self._frame_ids = {}
+        self._slot_obstacles = []
+        self._obstacle_slots = {}
+        self._free_slots = []
+        self._released = []
+        self._active = []
+        self._spawned = []
+        # TickProfiler timing phases of the step: garbage spawn and move, projectiles move and hits, drawing
+        self.profiler = None
+
+    def __len__(self):
+        return len(self._active) + len(self._spawned)
+
+    def count(self, kind):
+        kinds = self.kinds
+        return (sum(1 for slot in self._active if kinds[slot] == kind)
+                + sum(1 for slot in self._spawned if kinds[slot] == kind))
+
+    def spawn_garbage(self, column, frame, speed=0.5):
+        """Spawn garbage flying from top to bottom. Column position will stay same, as specified on start."""
+
+        if frame not in self._frame_ids:
+            self._frame_ids[frame] = len(self.frames)
+            self.frames.append(frame)
+        return self._spawn(GARBAGE, 0, column, speed, 0, frame.rows, frame.columns, self._frame_ids[frame])
+
+    def spawn_projectile(self, row, column, rows_speed=-0.3, columns_speed=0):
+        """Spawn gun shot, direction and speed can be specified."""
+
+        return self._spawn(PROJECTILE, row, column, rows_speed, columns_speed, 1, 1, 0)
+
+    def _spawn(self, kind, row, column, row_speed, column_speed, rows_size, columns_size, frame_id):
+        values = kind, 1, 0, row, column, row_speed, column_speed, rows_size, columns_size, frame_id
+        fields = (self.kinds, self.alive, self.ages, self.rows, self.columns, self.row_speeds, self.column_speeds,
+                  self.rows_size, self.columns_size, self.frame_ids)
+
+        if self._free_slots:
+            self.reused_slots += 1
+            slot = self._free_slots.pop()
+            for field, value in zip(fields, values):
+                field[slot] = value
+        else:
+            slot = len(self.kinds)
+            for field, value in zip(fields, values):
+                field.append(value)
+            self._slot_obstacles.append(None)
+
+        self._spawned.append(slot)
+        return slot
+
+    def _free(self, slot):
+        self.alive[slot] = 0
+        obstacle = self._slot_obstacles[slot]
+        if obstacle is not None:
+            self.obstacles.remove(obstacle)
+            del self._obstacle_slots[obstacle.uid]
+            self.obstacle_pool.release(obstacle)
+            self._slot_obstacles[slot] = None
+        # slot can be reused only after the step, when it is not in the active list anymore
+        self._released.append(slot)
+
+    def pool_stats(self):
+        """Return usage stats of entity slots and obstacles pool."""
+
+        created = len(self.kinds)
+        acquired = created + self.reused_slots
+        return {
+            'slots': {
+                'free': len(self._free_slots) + len(self._released),
+                'created': created,
+                'reused': self.reused_slots,
+                'hit_rate': self.reused_slots / acquired if acquired else 0,
+            },
+            'obstacles': self.obstacle_pool.stats(),
+        }
+
+    def step(self, canvas):
+        """Advance and draw all entities. Return centers (row, column) of garbage destroyed by collisions."""
+
+        started_at = time.perf_counter()
+        rows_number, columns_number = canvas.getmaxyx()
+
+        for slot in self._spawned:
+            if self.kinds[slot] == GARBAGE:
+                self.columns[slot] = min(max(self.columns[slot], 0), columns_number - 1)
+                obstacle = self.obstacle_pool.acquire(
+                    self.rows[slot], self.columns[slot], self.rows_size[slot], self.columns_size[slot], None,
+                    self.frames[self.frame_ids[slot]].mask)
+                self._slot_obstacles[slot] = obstacle
+                self.obstacles.add(obstacle)
+                self._obstacle_slots[obstacle.uid] = slot
+        self._active.extend(self._spawned)
+        self._spawned = []
+
+        self._move_garbage(rows_number)
+        garbage_moved_at = time.perf_counter()
+        gone = self._move_projectiles(rows_number, columns_number)
+        self._hit_obstacles_by_projectiles()
+        for slot in gone:
+            if self.alive[slot]:
+                self._free(slot)
+        destroyed = self._destroy_hit_garbage()
+        projectiles_moved_at = time.perf_counter()
+        self._draw(canvas)
+        if self.profiler:
+            self.profiler.add_phase('EntityStore.garbage', garbage_moved_at - started_at)
+            self.profiler.add_phase('EntityStore.projectiles', projectiles_moved_at - garbage_moved_at)
+            self.profiler.add_phase('EntityStore.draw', time.perf_counter() - projectiles_moved_at)
+
+        alive = self.alive
+        self._active = [slot for slot in self._active if alive[slot]]
+        for slot in self._active:
+            self.ages[slot] += 1
+        self._free_slots.extend(self._released)
+        self._released = []
+        return destroyed
+
+    def _move_projectiles(self, rows_number, columns_number):
+        """Move projectiles, return slots of ones which left the screen, they still can hit something on the way."""
+
+        kinds, ages = self.kinds, self.ages
+        rows, columns, row_speeds, column_speeds = self.rows, self.columns, self.row_speeds, self.column_speeds
+        max_row, max_column = rows_number - 1, columns_number - 1
+
+        gone = []
+        for slot in self._active:
+            if kinds[slot] != PROJECTILE or ages[slot] < len(PROJECTILE_FLASH):
+                continue
+            if ages[slot] == len(PROJECTILE_FLASH):
+                beep()
+            rows[slot] += row_speeds[slot]
+            columns[slot] += column_speeds[slot]
+            if not (0 < rows[slot] < max_row and 0 < columns[slot] < max_column):
+                gone.append(slot)
+        return gone
+
+    def _hit_obstacles_by_projectiles(self):
+        kinds, alive, ages, rows, columns = self.kinds, self.alive, self.ages, self.rows, self.columns
+        row_speeds, column_speeds = self.row_speeds, self.column_speeds
+        cell_size = self.obstacles.cell_size
+
+        # projectiles whose paths touch the same grid cells share the list of nearby obstacles
+        cells = defaultdict(list)
+        for slot in self._active:
+            if kinds[slot] == PROJECTILE and alive[slot] and ages[slot] >= len(PROJECTILE_FLASH):
+                row, column = round(rows[slot]), round(columns[slot])
+                start_row = round(rows[slot] - row_speeds[slot])
+                start_column = round(columns[slot] - column_speeds[slot])
+                # one more row below, garbage moves down and the path is tested relative to it
+                first_row, last_row = min(row, start_row), max(row, start_row) + 1
+                first_column, last_column = min(column, start_column), max(column, start_column)
+                path_cells = (first_row // cell_size, first_column // cell_size,
+                              last_row // cell_size, last_column // cell_size)
+                cells[path_cells].append((slot, start_row, start_column, row, column))
+
+        for (first_row, first_column, last_row, last_column), projectiles in cells.items():
+            nearby = self.obstacles.get_nearby(first_row * cell_size, first_column * cell_size,
+                                               (last_row - first_row) * cell_size + 1,
+                                               (last_column - first_column) * cell_size + 1)
+            if not nearby:
+                continue
+            for slot, start_row, start_column, row, column in projectiles:
+                for obstacle in nearby:
+                    if obstacle.has_swept_collision(start_row, start_column, row, column):
+                        self.obstacles.mark_hit(obstacle)
+                        self._free(slot)
+                        break
+
+    def _move_garbage(self, rows_number):
+        kinds, alive, ages, rows, row_speeds = self.kinds, self.alive, self.ages, self.rows, self.row_speeds
+        slot_obstacles = self._slot_obstacles
+
+        for slot in self._active:
+            if kinds[slot] != GARBAGE or not alive[slot]:
+                continue
+            obstacle = slot_obstacles[slot]
+            obstacle.previous_row = obstacle.row
+            if ages[slot]:
+                rows[slot] += row_speeds[slot]
+                obstacle.row = rows[slot]
+                self.obstacles.move(obstacle)
+            if rows[slot] >= rows_number:
+                self._free(slot)
+
+    def _destroy_hit_garbage(self):
+        destroyed = []
+        for obstacle in self.obstacles.drain_hits():
+            slot = self._obstacle_slots.get(obstacle.uid)
+            if slot is None:
+                continue
+            destroyed.append((self.rows[slot] + self.rows_size[slot] / 2,
+                              self.columns[slot] + self.columns_size[slot] / 2))
+            self._free(slot)
+        return destroyed
+
+    def _draw(self, canvas):
+        kinds, alive, ages, rows, columns = self.kinds, self.alive, self.ages, self.rows, self.columns
+        frames, frame_ids = self.frames, self.frame_ids
+
+        for slot in self._active:
+            if not alive[slot]:
+                continue
+            if kinds[slot] == GARBAGE:
+                frames[frame_ids[slot]].sprite.draw(canvas, rows[slot], columns[slot])
+            elif ages[slot] < len(PROJECTILE_FLASH):
+                canvas.addstr(round(rows[slot]), round(columns[slot]), PROJECTILE_FLASH[ages[slot]])
+            else:
+                symbol = '-' if self.column_speeds[slot] else '|'
+                canvas.addstr(round(rows[slot]), round(columns[slot]), symbol)
@@ -1,6 +1,11 @@
-import asyncio
-import curses
-from curses_tools import draw_frame, get_frame_size
+import time
+
+from curses_tools import beep, draw_frame, get_frame_size
+from pool import Pool
+from scheduler import next_tick
+
+# every explosion frame is shown for this number of ticks
+FRAME_TICKS = 2
 
 EXPLOSION_FRAMES = [
     """\
@@ -35,11 +40,59 @@ async def explode(canvas, center_row, center_column):
     corner_row = center_row - rows / 2
     corner_column = center_column - columns / 2
 
-    curses.beep()
+    beep()
     for frame in EXPLOSION_FRAMES:
 
         draw_frame(canvas, corner_row, corner_column, frame)
 
-        await asyncio.sleep(0)
-        draw_frame(canvas, corner_row, corner_column, frame, negative=True)
-        await asyncio.sleep(0)
+        for _ in range(FRAME_TICKS):
+            await next_tick()
+
+
+class Explosion:
+
+    __slots__ = ('corner_row', 'corner_column', 'age')
+
+    def __init__(self, center_row, center_column):
+        self.reset(center_row, center_column)
+
+    def reset(self, center_row, center_column):
+        rows, columns = get_frame_size(EXPLOSION_FRAMES[0])
+        self.corner_row = center_row - rows / 2
+        self.corner_column = center_column - columns / 2
+        self.age = 0
+
+
+class Explosions:
+    """All explosions, drawn by a single step per tick instead of a coroutine per explosion.
+
+    Explosion objects are pooled. Explosion started during the tick is drawn by the same tick step.
+    """
+
+    def __init__(self):
+        self.pool = Pool(Explosion)
+        self._active = []
+        # TickProfiler timing the step
+        self.profiler = None
+
+    def __len__(self):
+        return len(self._active)
+
+    def start(self, center_row, center_column):
+        beep()
+        self._active.append(self.pool.acquire(center_row, center_column))
+
+    def step(self, canvas):
+        started_at = time.perf_counter()
+        active = []
+        for explosion in self._active:
+            draw_frame(canvas, explosion.corner_row, explosion.corner_column,
+                       EXPLOSION_FRAMES[explosion.age // FRAME_TICKS])
+            explosion.age += 1
+            if explosion.age < len(EXPLOSION_FRAMES) * FRAME_TICKS:
+                active.append(explosion)
+            else:
+                self.pool.release(explosion)
+        self._active = active
+        if self.profiler:
+            self.profiler.add_phase('Explosions.step', time.perf_counter() - started_at)
@@ -0,0 +1,327 @@
+import asyncio
+import curses
+import math
+import random
+from itertools import cycle
+from typing import Optional
+
+from assets import get_frame, get_frames
+from curses_tools import draw_frame, get_sprite
+from entities import EntityStore
+from explosion import explode, Explosions
+from game_scenario import load_scenario
+from obstacles import Obstacle, ObstaclesGrid, show_obstacles  # noqa: F401
+from physics import bound_move, update_speed
+from scheduler import next_tick, Scheduler, sleep_tics
+from starfield import Starfield
+
+YEAR_DURATION = 1.0
+TIMES = [2.0, 0.3, 0.5, 0.3]
+
+STARS_NUM = 100
+HUD_WIDTH = 32
+
+
+def get_rocket_frames(kind: str):
+    return [frame.text for frame in get_frames('rocket') if frame.name.startswith(f'rocket_frame_{kind}_')]
+
+
+def get_garbage_frames():
+    return [frame.text for frame in get_frames('garbage')]
+
+
+def get_game_over_frame():
+    return get_frame('game_over', 'game_over').text
+
+
+def get_frame_size(frame):
+    rows = frame.split('\n')
+    return max(len(row) for row in rows), len(rows)
+
+
+async def sleep(tics=1):
+    await sleep_tics(tics)
+
+
+def get_collided_obstacle(obstacles, obj_row, obj_column, obj_size_rows=1, obj_size_columns=1,
+                          obj_mask=None) -> Optional[Obstacle]:
+    for obstacle in obstacles.get_nearby(obj_row, obj_column, obj_size_rows, obj_size_columns):
+        if obstacle.has_collision(obj_row, obj_column, obj_size_rows, obj_size_columns, obj_mask):
+            return obstacle
+
+
+class Game:
+    """State and coroutines of a single game session.
+
+    Games share nothing but read-only frames and sprites, so many of them can run in one process.
+    canvas and sub are foreground layers of game and footer renderers; read_controls(canvas)
+    returns controls state of the player, clock converts seconds to tics.
+    scenario is game_scenario.Scenario, scenario.json by default.
+    """
+
+    def __init__(self, canvas, sub, read_controls, clock, stars_num=STARS_NUM, seed=None, immortal=False,
+                 profiler=None, hud=False, scenario=None):
+        self.canvas = canvas
+        self.sub = sub
+        self.read_controls = read_controls
+        self.clock = clock
+        self.immortal = immortal
+        self.profiler = profiler
+        self.tics_per_year = clock.seconds_to_tics(YEAR_DURATION)
+        self.scenario = scenario or load_scenario()
+
+        # all randomness of the game comes from here, so a session can be replayed from its seed and controls
+        self.seed = random.randrange(2 ** 64) if seed is None else seed
+        self.rng = rng = random.Random(self.seed)
+
+        self.scheduler = Scheduler()
+        self.scheduler.profiler = profiler
+        if profiler:
+            profiler.pool_stats = self.get_pool_stats
+        self.obstacles = ObstaclesGrid()
+        self.entities = EntityStore(self.obstacles)
+        self.explosions = Explosions()
+        self.entities.profiler = self.explosions.profiler = profiler
+        self.year = self.scenario.start_year
+        self.plasma_unblocked = False
+        self.game_over = False
+        self._last_phrase = None
+        self._last_phrase_args = None
+        # tick the stopped phrase disappears at, None while it runs in
+        self._phrase_deadline = None
+        # grows on every resize, a phrase drawn before doesn't erase itself from the new layout
+        self._layout = 0
+        # column after the phrase stopped in the footer, the HUD takes only columns to the right of it
+        self._phrase_end = 0
+        self.hud = hud
+        # (column, width) of the HUD on the footer background
+        self._hud_span = None
+
+        row_max, col_max = canvas.getmaxyx()
+        symbols = '+*.:'
+
+        self.starfield = Starfield(
+            rows=[rng.randint(1, row_max - 2) for _ in range(stars_num)],
+            columns=[rng.randint(1, col_max - 2) for _ in range(stars_num)],
+            symbols=[rng.choice(symbols) for _ in range(stars_num)],
+            delays=[rng.randint(0, clock.seconds_to_tics(1.0)) for _ in range(stars_num)],
+            phase_tics=[clock.seconds_to_tics(duration) for duration in TIMES],
+        )
+        self.scheduler.spawn(self.starfield.animate(canvas.renderer.background))
+
+        self.scheduler.spawn(self.animate_spaceship(canvas,
+                                                    row_max // 2,
+                                                    col_max // 2,
+                                                    {'basic': get_rocket_frames('basic'),
+                                                     'plasma': get_rocket_frames('plasma')}))
+
+        self.scheduler.spawn(self.run_entities(canvas))
+        self.scheduler.spawn(self.run_scenario(canvas, sub))
+        if hud:
+            self.scheduler.spawn(self.show_hud(sub))
+
+    def finish_game(self, canvas):
+        self.game_over = True
+        self.scheduler.spawn(self.show_gameover(canvas))
+
+    async def animate_spaceship(self, canvas, row, column, frames):
+        basic_frames = frames['basic']
+        plasma_frames = frames['plasma']
+        frame_width, frame_height = get_frame_size(plasma_frames[0])
+
+        row_speed = column_speed = 0
+
+        #  "doubling" frames
+        frame_nums = range(len(plasma_frames))
+        frame_nums = [num for num in frame_nums for _ in range(2)]
+        for frame_num in cycle(frame_nums):
+            frame = (basic_frames if not self.plasma_unblocked else plasma_frames)[frame_num]
+            rd, cd, space_pressed = self.read_controls(canvas)
+            row_speed, column_speed = update_speed(row_speed, column_speed, rd, cd)
+
+            # bounds are read every tick, the screen may be resized
+            row_max, col_max = canvas.getmaxyx()
+            row_max -= frame_height
+            col_max -= frame_width
+            row = row + row_speed
+            column = column + column_speed
+            row, column, row_speed, column_speed = bound_move(row, column, row_speed, column_speed, row_max, col_max)
+
+            mask = get_sprite(frame).mask
+            collided = not self.immortal and self.get_collided_obstacle(row, column, frame_height, frame_width, mask)
+            if collided:
+                self.obstacles.mark_hit(collided)
+                # First show explosion, then show game over.
+                # To synchronize obstacle and spaceship explosions, start the latter one tick later.
+                await next_tick()
+                await explode(canvas, row + frame_height / 2, column + frame_width / 2)
+                self.finish_game(canvas)
+                return
+
+            draw_frame(canvas, row, column, frame)
+            if space_pressed and self.plasma_unblocked:
+                self.entities.spawn_projectile(row, column + frame_width // 2, rows_speed=-2)
+            await next_tick()
+
+    async def run_entities(self, canvas):
+        """Animate garbage and gun shots, explode garbage hit by shots or by the spaceship."""
+        while True:
+            for row, column in self.entities.step(canvas):
+                self.explosions.start(row, column)
+            self.explosions.step(canvas)
+            await next_tick()
+
+    async def fill_orbit_with_garbage(self, canvas):
+        garbage_frames = get_frames('garbage')
+        while True:
+            delay_tics = self.scenario.get_garbage_delay_tics(self.year)
+            assert delay_tics is not None
+            await sleep(delay_tics)
+            _, col_max = canvas.getmaxyx()
+            garbage = self.rng.choice(garbage_frames)
+            column = self.rng.randint(0, col_max - garbage.columns)
+            self.entities.spawn_garbage(column, garbage)
+
+    async def show_gameover(self, canvas):
+        frame = get_game_over_frame()
+        frame_width, frame_height = get_frame_size(frame)
+
+        while True:
+            row_max, col_max = canvas.getmaxyx()
+            row = row_max / 2 - frame_height / 2
+            column = col_max / 2 - frame_width / 2
+            draw_frame(canvas, row, column, frame)
+            await next_tick()
+
+    def collides_with_obstacle(self, obj_row, obj_column, obj_size_rows=1, obj_size_columns=1, obj_mask=None):
+        return self.get_collided_obstacle(obj_row, obj_column, obj_size_rows, obj_size_columns, obj_mask) is not None
+
+    def get_collided_obstacle(self, obj_row, obj_column, obj_size_rows=1, obj_size_columns=1,
+                              obj_mask=None) -> Optional[Obstacle]:
+        return get_collided_obstacle(self.obstacles, obj_row, obj_column, obj_size_rows, obj_size_columns, obj_mask)
+
+    async def run_scenario(self, canvas, footer_canvas):
+        """Count years and run scenario events, waking up only when the year changes or an event is due."""
+        events = self.scenario.compile(self.tics_per_year)
+        tics_per_year = self.tics_per_year
+        self.year = self.scenario.start_year
+        event_index = 0
+        tick = 0
+
+        while not self.game_over:
+            if tick % tics_per_year == 0:
+                self.show_year(footer_canvas)
+            while event_index < len(events) and events[event_index].tick <= tick:
+                self.run_event(canvas, footer_canvas, events[event_index])
+                event_index += 1
+
+            wake_tick = (tick // tics_per_year + 1) * tics_per_year
+            if event_index < len(events):
+                wake_tick = min(wake_tick, events[event_index].tick)
+            await sleep(wake_tick - tick)
+
+            tick = wake_tick
+            self.year = self.scenario.start_year + tick // tics_per_year
+
+    def run_event(self, canvas, footer_canvas, event):
+        if event.kind == 'phrase':
+            self.show_phrase(footer_canvas, *event.value)
+        elif event.value == 'garbage':
+            self.scheduler.spawn(self.fill_orbit_with_garbage(canvas))
+            # to visualize obstacle frames
+            # self.scheduler.spawn(show_obstacles(canvas, self.obstacles))
+        elif event.value == 'plasma_gun':
+            self.plasma_unblocked = True
+
+    def show_year(self, canvas):
+        _, col_max = canvas.getmaxyx()
+        canvas.renderer.background.addstr(0, col_max - 12, f"Year: {self.year}")
+
+    async def _show_phrase(self, canvas, phrase, ticks):
+        sub_row_max, sub_col_max = canvas.getmaxyx()
+        # stopped phrase stays on the persistent layer, so it isn't redrawn every tick
+        background = canvas.renderer.background
+
+        col = - len(phrase)
+        stop = (sub_col_max - len(phrase)) // 2
+        # the phrase moves by 6 columns, it stops at the first step past the center
+        stop = col + max(0, math.ceil((stop - col) / 6)) * 6
+
+        # free the columns of the phrase before it runs in, spaces of the phrase don't erase what is under them
+        self._phrase_end = stop + len(phrase)
+        self._phrase_deadline = None
+        self.draw_hud(canvas)
+        layout = self._layout
+        try:
+            while col < stop:
+                draw_frame(canvas, 0, col, phrase)
+                await next_tick()
+                col += 6
+
+            draw_frame(background, 0, col, phrase)
+            self._phrase_deadline = self.scheduler.tick + ticks
+            await sleep(ticks)
+        except asyncio.CancelledError:
+            if layout != self._layout:
+                return
+        draw_frame(background, 0, col, phrase, negative=True)
+        self._phrase_end = 0
+        self.draw_hud(canvas)
+
+    def show_phrase(self, canvas, phrase, ticks):
+        if self._last_phrase:
+            self.scheduler.cancel(self._last_phrase)
+        self._last_phrase = self.scheduler.spawn(self._show_phrase(canvas, phrase, ticks))
+        self._last_phrase_args = canvas, phrase, ticks
+
+    async def show_hud(self, canvas):
+        """Show game loop timings in the footer, next to the year."""
+        while True:
+            self.draw_hud(canvas)
+            await sleep(self.tics_per_year)
+
+    def draw_hud(self, canvas):
+        """Draw the HUD between the phrase and the year, it is hidden while the phrase leaves no room for it."""
+        if not self.hud:
+            return
+        background = canvas.renderer.background
+        if self._hud_span:
+            column, width = self._hud_span
+            background.addstr(0, column, ' ' * width)
+            self._hud_span = None
+
+        _, col_max = canvas.getmaxyx()
+        hud_end = col_max - 14
+        hud_column = max(hud_end - HUD_WIDTH, self._phrase_end + 1)
+        text = self.profiler.get_hud_text()
+        if len(text) > hud_end - hud_column:
+            return
+        background.addstr(0, hud_end - len(text), text, curses.A_DIM)
+        self._hud_span = hud_end - len(text), len(text)
+
+    def get_pool_stats(self):
+        return {'explosions': self.explosions.pool.stats(), **self.entities.pool_stats()}
+
+    def resize(self, canvas_window, sub_window):
+        """Move the running game to windows of a new size.
+
+        Coroutines, entities and layers are kept, they read bounds every tick. Only what is kept
+        on persistent layers is redrawn: stars are moved proportionally, the year and the phrase are shown again.
+        """
+        old_size = self.canvas.getmaxyx()
+        self.canvas.renderer.resize(canvas_window)
+        self.sub.renderer.resize(sub_window)
+
+        self._layout += 1
+        self.starfield.fit(old_size, self.canvas.getmaxyx())
+        self.starfield.draw(self.canvas.renderer.background)
+        self.show_year(self.sub)
+        self._phrase_end = 0
+        self._hud_span = None
+        self.draw_hud(self.sub)
+        if self._last_phrase in self.scheduler:
+            canvas, phrase, ticks = self._last_phrase_args
+            if self._phrase_deadline is not None:
+                # the phrase is shown again for the rest of its time only
+                ticks = max(self._phrase_deadline - self.scheduler.tick, 1)
+            self.show_phrase(canvas, phrase, ticks)
@@ -1,29 +1,78 @@
-PHRASES = {
-    1957: "First Sputnik",
-    1961: "Gagarin flew!",
-    1969: "Armstrong got on the moon!",
-    1971: "First orbital space station Salute-1",
-    1981: "Flight of the Shuttle Columbia",
-    1998: 'ISS start building',
-    2011: 'Messenger launch to Mercury',
-    2021: 'Russia tests anti-satellite weapon, now tons of garbage',
-}
-
-
-def get_garbage_delay_tics(year):
-    if year < 1961:
-        return None
-    elif year < 1969:
-        return 20
-    elif year < 1981:
-        return 18
-    elif year < 1995:
-        return 16
-    elif year < 2010:
-        return 14
-    elif year < 2021:
-        return 12
-    elif year < 2025:
-        return 10
-    else:
-        return 8
+import json
+import os
+from bisect import bisect_right
+from collections import namedtuple
+from functools import lru_cache
+
+SCENARIO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenario.json')
+
+# phrases are shown in the footer for this number of ticks, unless an event sets its own
+PHRASE_TICKS = 40
+UNLOCKS = ('garbage', 'plasma_gun')
+
+# kind is 'phrase' (value is (text, ticks)) or 'unlock' (value is one of UNLOCKS)
+Event = namedtuple('Event', ['tick', 'kind', 'value'])
+
+
+class Scenario:
+    """Timeline of the game: phrases and unlocks by year and garbage spawn rate by year brackets.
+
+    events — dicts with "year" (may be fractional) and any of "phrase", "phrase_ticks", "unlock".
+    garbage_delays — (from_year, delay_tics) brackets, no garbage before the first one.
+    Scenario is read-only, so one can be shared by all games of the process.
+    """
+
+    def __init__(self, start_year, events, garbage_delays):
+        self.start_year = start_year
+        garbage_delays = sorted(garbage_delays)
+        self._rate_years = [year for year, _ in garbage_delays]
+        self._rate_delays = [delay for _, delay in garbage_delays]
+        self._events = []
+        self._compiled = {}
+
+        for event in events:
+            year = event['year']
+            if year < start_year:
+                raise ValueError(f'Event of year {year} is before the start year {start_year}')
+            unknown_keys = set(event) - {'year', 'phrase', 'phrase_ticks', 'unlock'}
+            if unknown_keys:
+                raise ValueError(f'Unknown keys {sorted(unknown_keys)} in event of year {year}')
+            if 'phrase' in event:
+                self._events.append((year, 'phrase', (event['phrase'], event.get('phrase_ticks', PHRASE_TICKS))))
+            unlock = event.get('unlock')
+            if unlock is None:
+                continue
+            if unlock not in UNLOCKS:
+                raise ValueError(f'Unknown unlock {unlock!r} in event of year {year}. Expects one of {UNLOCKS}.')
+            if unlock == 'garbage' and self.get_garbage_delay_tics(year) is None:
+                raise ValueError(f'Garbage is unlocked in {year}, before its first delay bracket')
+            self._events.append((year, 'unlock', unlock))
+
+        # events of the same year keep their order from the file
+        self._events.sort(key=lambda event: event[0])
+
+    def __len__(self):
+        return len(self._events)
+
+    def get_garbage_delay_tics(self, year):
+        """Return tics between garbage spawns in the year, None if there is no garbage yet."""
+
+        index = bisect_right(self._rate_years, year) - 1
+        return self._rate_delays[index] if index >= 0 else None
+
+    def compile(self, tics_per_year):
+        """Return events as a list sorted by tick, ticks are counted from the start of the game."""
+
+        if tics_per_year not in self._compiled:
+            self._compiled[tics_per_year] = [Event(round((year - self.start_year) * tics_per_year), kind, value)
+                                             for year, kind, value in self._events]
+        return self._compiled[tics_per_year]
+
+
+@lru_cache(maxsize=None)
+def load_scenario(path=SCENARIO_PATH):
+    """Load scenario from JSON file, see scenario.json. Scenarios are cached by path."""
+
+    with open(path, 'r') as file:
+        config = json.load(file)
+    return Scenario(config['start_year'], config.get('events', []), config.get('garbage_delay_tics', []))
@@ -0,0 +1,221 @@
+import argparse
+import curses
+import time
+from collections import deque
+from itertools import cycle
+
+import curses_tools
+import main
+from asciicast import AsciicastRecorder
+from assets import load_assets
+from profiler import TickProfiler
+from entities import GARBAGE, PROJECTILE
+from game import Game
+from game_scenario import load_scenario
+from renderer import Renderer
+from replay import ControlsReplay
+from scheduler import TickClock
+
+# fly from side to side shooting and dodging a bit
+AUTOPILOT_CONTROLS = (
+    [(0, -1, True)] * 15 + [(-1, 0, False)] * 3 + [(0, 1, True)] * 30 + [(1, 0, False)] * 3 + [(0, -1, True)] * 15
+)
+
+
+class FakeCanvas:
+    """In-memory replacement of curses window for runs without terminal."""
+
+    def __init__(self, rows, columns, begin_row=0, begin_column=0):
+        self.rows, self.columns = rows, columns
+        self.begin_row, self.begin_column = begin_row, begin_column
+        self.cells = {}
+        self.keys = deque()
+        self.refreshes = 0
+
+    def getmaxyx(self):
+        return self.rows, self.columns
+
+    def getbegyx(self):
+        return self.begin_row, self.begin_column
+
+    def addstr(self, row, column, text, attr=0):
+        if not (0 <= row < self.rows and 0 <= column and column + len(text) <= self.columns):
+            raise curses.error('addstr() returned ERR')
+        for column, symbol in enumerate(text, column):
+            self.cells[row, column] = symbol, attr
+
+    def addch(self, row, column, symbol, attr=0):
+        self.addstr(row, column, symbol if isinstance(symbol, str) else chr(symbol), attr)
+
+    def getch(self):
+        return self.keys.popleft() if self.keys else -1
+
+    def refresh(self):
+        self.refreshes += 1
+
+    def noutrefresh(self):
+        self.refreshes += 1
+
+    def erase(self):
+        self.cells.clear()
+
+    def keypad(self, flag):
+        pass
+
+    def nodelay(self, flag):
+        pass
+
+    def derwin(self, rows, columns, begin_row, begin_column):
+        return FakeCanvas(rows, columns, self.begin_row + begin_row, self.begin_column + begin_column)
+
+    def dump(self):
+        """Return window content as text."""
+
+        return '\n'.join(
+            ''.join(self.cells.get((row, column), ' ')[0] for column in range(self.columns))
+            for row in range(self.rows)
+        )
+
+
+class ScriptedControls:
+    """Source of controls which returns the given (rows_direction, columns_direction, space_pressed) tuples.
+
+    One tuple is returned per tick, in cycle.
+    """
+
+    def __init__(self, controls):
+        self._controls = cycle(controls)
+
+    @classmethod
+    def from_file(cls, path):
+        controls = []
+        with open(path, 'r') as file:
+            for line in file:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                rows_direction, columns_direction, space = line.split()
+                controls.append((int(rows_direction), int(columns_direction), space not in ('0', 'False')))
+        return cls(controls)
+
+    def __call__(self, canvas):
+        return next(self._controls)
+
+
+def create_screen(rows, columns):
+    """Create fake game and footer windows laid out the same way as `main.draw` does."""
+
+    return main.layout_windows(rows, columns, FakeCanvas(rows, columns).derwin)
+
+
+def run_headless(until_year=2030, size=(40, 120), read_controls=None, stars_num=main.STARS_NUM, seed=None,
+                 record_input_path=None, stop=None, resizes=None, record_path=None, immortal=False, profiler=None,
+                 hud=False, scenario=None):
+    """Run the game without terminal and sleeping till the year is over, the game is lost or stop() returns True.
+
+    resizes — {tick: (rows, columns)}, screen sizes to switch to at given ticks.
+    record_path — asciicast file to record the screen to.
+    Return report with game loop performance, entities counts and the final screen.
+    """
+
+    curses_tools.sound_enabled = False
+    clock = TickClock(main.TIC_TIMEOUT, realtime=False)
+    read_controls = read_controls or ScriptedControls(AUTOPILOT_CONTROLS)
+
+    canvas_window, sub_window = create_screen(*size)
+    renderers = Renderer(canvas_window), Renderer(sub_window)
+    game = Game(renderers[0].foreground, renderers[1].foreground, read_controls, clock, stars_num, seed, immortal,
+                profiler, hud, scenario)
+    recorder = record_input_path and main.record_controls(record_input_path, game, stars_num)
+    screen_recorder = record_path and AsciicastRecorder(record_path, (canvas_window, sub_window))
+
+    def should_stop():
+        return game.year > until_year or game.game_over or stop is not None and stop()
+
+    def resize():
+        if resizes and game.scheduler.tick in resizes:
+            return create_screen(*resizes[game.scheduler.tick])
+
+    started_at = time.perf_counter()
+    main.run_game(game, renderers, update_screen=lambda: None, stop=should_stop, resize=resize,
+                  screen_recorders=[screen_recorder] if screen_recorder else [])
+    duration = time.perf_counter() - started_at
+    if recorder:
+        recorder.close()
+    if screen_recorder:
+        screen_recorder.close()
+
+    ticks = game.scheduler.tick
+    report = {
+        'ticks': ticks,
+        'seconds': duration,
+        'ticks_per_second': ticks / duration if duration else 0,
+        'seed': game.seed,
+        'year': game.year,
+        'game_over': game.game_over,
+        'entities': {
+            'coroutines': len(game.scheduler),
+            'stars': len(game.starfield),
+            'garbage': game.entities.count(GARBAGE),
+            'projectiles': game.entities.count(PROJECTILE),
+            'obstacles': len(game.obstacles),
+            'explosions': len(game.explosions),
+        },
+        'pools': game.get_pool_stats(),
+        'screen': renderers[0].window.dump() + '\n' + renderers[1].window.dump(),
+    }
+    game.scheduler.close()
+    return report
+
+
+def print_report(report):
+    print(report['screen'])
+    print()
+    print(f"{report['ticks']} ticks in {report['seconds']:.2f}s, {report['ticks_per_second']:.0f} ticks per second")
+    print(f"Year: {report['year']}{', game over' if report['game_over'] else ''}, seed: {report['seed']}")
+    print(', '.join(f'{name}: {count}' for name, count in report['entities'].items()))
+    print('pools: ' + ', '.join(f"{name} {stats['created']} created, {stats['hit_rate']:.0%} reused"
+                                for name, stats in report['pools'].items()))
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description='Run the game without terminal as fast as possible and report its performance',
+    )
+    main.add_game_arguments(parser)
+    parser.add_argument('--until-year', type=int, default=2030,
+                        help='Year to stop the run at')
+    parser.add_argument('--controls', default=None,
+                        help='File with controls, one "rows_direction columns_direction space" line per tick, '
+                             'repeated till the end of the run')
+    parser.add_argument('--size', default='40x120',
+                        help='Screen size ROWSxCOLUMNS')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of the game randomness')
+    parser.add_argument('--resize', action='append', default=[], metavar='TICK:ROWSxCOLUMNS',
+                        help='Resize the screen at the tick, may be repeated')
+    return parser
+
+
+if __name__ == '__main__':
+    args = create_parser().parse_args()
+    load_assets(args.assets_bundle)
+    immortal = args.immortal
+    scenario = load_scenario(args.scenario) if args.scenario else None
+    profiler = TickProfiler() if args.hud or args.profile else None
+    rows, columns = map(int, args.size.split('x'))
+    controls = ScriptedControls.from_file(args.controls) if args.controls else None
+    stars_num, seed, stop = args.stars, args.seed, None
+    if args.replay:
+        controls = ControlsReplay(args.replay)
+        header = controls.header
+        rows, columns = header.rows + 4, header.columns + 2
+        stars_num, seed, immortal = header.stars_num, header.seed, header.immortal
+        stop = lambda: controls.finished  # noqa: E731
+    resizes = {}
+    for resize in args.resize:
+        tick, size = resize.split(':')
+        resizes[int(tick)] = tuple(map(int, size.split('x')))
+    print_report(run_headless(args.until_year, (rows, columns), controls, stars_num, seed, args.record_input, stop,
+                              resizes, args.record, immortal, profiler, args.hud, scenario))
+    if args.profile:
+        profiler.dump(args.profile)
@@ -0,0 +1,123 @@
+import os
+import select
+import threading
+import time
+from collections import deque
+
+from curses_tools import DOWN_KEY_CODE, get_controls, LEFT_KEY_CODE, RIGHT_KEY_CODE, UP_KEY_CODE
+
+ESCAPE = b'\x1b'
+ESCAPE_SEQUENCES = {
+    b'\x1b[A': UP_KEY_CODE, b'\x1bOA': UP_KEY_CODE,
+    b'\x1b[B': DOWN_KEY_CODE, b'\x1bOB': DOWN_KEY_CODE,
+    b'\x1b[C': RIGHT_KEY_CODE, b'\x1bOC': RIGHT_KEY_CODE,
+    b'\x1b[D': LEFT_KEY_CODE, b'\x1bOD': LEFT_KEY_CODE,
+}
+
+
+class KeyEventQueue:
+    """Queue of (key_code, pressed_at) events filled by a reader thread and drained by the game loop.
+
+    deque append and popleft are atomic, so no locks are needed. Press timestamps of drained events are kept
+    till the next frame is shown, to measure latency from key press to the screen update.
+    """
+
+    def __init__(self, timer=time.perf_counter):
+        self._events = deque()
+        self._timer = timer
+        self._undisplayed = []
+
+    def push(self, key_code, pressed_at=None):
+        self._events.append((key_code, self._timer() if pressed_at is None else pressed_at))
+
+    def drain(self):
+        events = []
+        popleft = self._events.popleft
+        while self._events:
+            events.append(popleft())
+        self._undisplayed.extend(pressed_at for _, pressed_at in events)
+        return events
+
+    def read_controls(self, canvas=None):
+        """Return controls state for keys pressed since the last call, drop-in replacement of `read_controls`."""
+
+        return get_controls(key_code for key_code, _ in self.drain())
+
+    def mark_displayed(self):
+        """Call when the screen is updated, return latencies of key presses handled since the previous update."""
+
+        if not self._undisplayed:
+            return []
+        now = self._timer()
+        latencies = [now - pressed_at for pressed_at in self._undisplayed]
+        self._undisplayed = []
+        return latencies
+
+
+class TerminalKeyReader:
+    """Background thread reading keys right from the terminal file descriptor into KeyEventQueue.
+
+    Keys are timestamped as soon as they arrive, not when the game loop gets to them.
+    Curses getch must not be used while the reader is running.
+    """
+
+    def __init__(self, queue, fd=0, escape_timeout=0.05):
+        self.queue = queue
+        self.fd = fd
+        self.escape_timeout = escape_timeout
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, name='key-reader', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        os.write(self._stop_w, b'\0')
+        self._thread.join()
+        os.close(self._stop_r)
+        os.close(self._stop_w)
+
+    def _run(self):
+        buffer = b''
+        while True:
+            # wait shortly for the rest of escape sequence, otherwise till key is pressed
+            timeout = self.escape_timeout if buffer else None
+            readable, _, _ = select.select([self.fd, self._stop_r], [], [], timeout)
+            if self._stop_r in readable:
+                return
+            if not readable:
+                buffer = b''
+                continue
+            try:
+                data = os.read(self.fd, 64)
+            except BlockingIOError:
+                continue
+            if not data:
+                return
+            buffer = self._parse(buffer + data)
+
+    def _parse(self, buffer):
+        """Push key events of complete key codes found in the buffer, return the unparsed rest."""
+
+        key_codes, buffer = parse_keys(buffer)
+        for key_code in key_codes:
+            self.queue.push(key_code)
+        return buffer
+
+
+def parse_keys(buffer):
+    """Return curses key codes of complete keys found in bytes read from a terminal and the unparsed rest."""
+
+    key_codes = []
+    while buffer:
+        if not buffer.startswith(ESCAPE):
+            key_codes.append(buffer[0])
+            buffer = buffer[1:]
+            continue
+        if len(buffer) < 3:
+            break
+        key_code = ESCAPE_SEQUENCES.get(buffer[:3])
+        if key_code is not None:
+            key_codes.append(key_code)
+        buffer = buffer[3:]
+    return key_codes, buffer
@@ -1,11 +1,16 @@
 from monitor import Monitor
 
 
-def read_controls():
+def start_controls_reading():
+    """Start keyboard monitor in advance, so the game doesn't wait for it on the first read_controls() call."""
     if not hasattr(read_controls, 'monitor'):
         read_controls.monitor = Monitor()
         read_controls.monitor.start()
         read_controls.controls = 0, 0, False
+
+
+def read_controls():
+    start_controls_reading()
     controls = read_controls.monitor.get_control_keys()
     if controls:
         row_direction = -1 if controls['up'] else 1 if controls['down'] else 0
@@ -16,4 +21,6 @@ def read_controls():
 
 
 def stop_controls_reading():
-    read_controls.monitor.stop()
+    if hasattr(read_controls, 'monitor'):
+        read_controls.monitor.stop()
+        del read_controls.monitor
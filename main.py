@@ -1,310 +1,118 @@
 import argparse
-import asyncio
 import curses
 import os
 import time
-from itertools import cycle
-from random import choice, randint
-from typing import Optional
 import signal
 import sys
+from contextlib import ExitStack
 
-from curses_tools import draw_frame
+from asciicast import AsciicastRecorder
+from assets import load_assets
 from curses_tools import read_controls
-from explosion import explode
-from game_scenario import get_garbage_delay_tics, PHRASES
-from obstacles import Obstacle, show_obstacles
-from physics import update_speed
+from game import Game, STARS_NUM
+from game_scenario import load_scenario
+from input_events import KeyEventQueue, TerminalKeyReader
+from profiler import TickProfiler
+from renderer import Renderer
+from replay import ControlsRecorder, ControlsReplay, SessionHeader
+from scheduler import TickClock
+from spectator import SpectatorFeed
 
 TIC_TIMEOUT = 0.1
-TICS_PER_YEAR = 10
-TIMES = [2.0, 0.3, 0.5, 0.3]
 
-STARS_NUM = 100
+# smaller terminal can't fit the spaceship and the footer, resizing to it is ignored
+MIN_SCREEN_SIZE = 16, 40
 
-coroutines = []
-obstacles = []
-obstacles_in_last_collisions = []
+clock = TickClock(TIC_TIMEOUT)
 
-year = 1957
-plasma_unblocked = False
-game_over = False
+# the game of this process, created by setup_game
+game = None
 
-
-def get_rocket_frames(kind: str):
-    rocket_frames = []
-    for filename in (f'rocket_frame_{kind}_{num}.txt' for num in range(1, 3)):
-        with open(f'frames/rocket/{filename}', 'r') as frame:
-            rocket_frames.append(frame.read())
-    return rocket_frames
-
-
-def get_garbage_frames():
-    grabage_frames = []
-    garbage_dir = 'frames/garbage'
-    for filename in os.listdir(garbage_dir):
-        with open(os.path.join(garbage_dir, filename)) as frame:
-            grabage_frames.append(frame.read())
-    return grabage_frames
-
-
-def get_game_over_frame():
-    frame_dir = 'frames/game_over'
-    with open(os.path.join(frame_dir, 'game_over.txt'), 'r') as frame:
-        return frame.read()
-
-
-def get_frame_size(frame):
-    rows = frame.split('\n')
-    return max(len(row) for row in rows), len(rows)
-
-
-async def sleep(tics=1):
-    for _ in range(tics):
-        await asyncio.sleep(0)
-
-
-def bound_move(row, column, row_speed, column_speed, row_max, column_max):
-    if row <= 0:
-        row = 0
-        row_speed = 0
-
-    if row >= row_max:
-        row = row_max
-        row_speed = 0
-
-    if column <= 0:
-        column = 0
-        column_speed = 0
-
-    if column >= column_max:
-        column = column_max
-        column_speed = 0
-
-    return row, column, row_speed, column_speed
+immortal = False
+profiler = None
+hud = False
+scenario = None
+threaded_input = False
+record_input_path = None
+record_path = None
+spectate_port = None
+spectate_compress = False
+replay = None
+terminal_resized = False
 
 
 def _read_controls(canvas):
     return read_controls(canvas)
 
 
-def finish_game(canvas):
-    global game_over
-    game_over = True
-    coroutines.append(show_gameover(canvas))
-
-
-async def animate_spaceship(canvas, row, column, frames):
-    basic_frames = frames['basic']
-    plasma_frames = frames['plasma']
-    frame_width, frame_height = get_frame_size(plasma_frames[0])
-    row_max, col_max = curses.window.getmaxyx(canvas)
-    row_max -= frame_height
-    col_max -= frame_width
-
-    row_speed = column_speed = 0
-
-    #  "doubling" frames
-    frame_nums = range(len(plasma_frames))
-    frame_nums = [num for num in frame_nums for _ in range(2)]
-    for frame_num in cycle(frame_nums):
-        frame = (basic_frames if not plasma_unblocked else plasma_frames)[frame_num]
-        # rd, cd, space_pressed = read_controls(canvas)
-        rd, cd, space_pressed = _read_controls(canvas)
-        row_speed, column_speed = update_speed(row_speed, column_speed, rd, cd)
-
-        row = row + row_speed
-        column = column + column_speed
-        row, column, row_speed, column_speed = bound_move(row, column, row_speed, column_speed, row_max, col_max)
-
-        if collided := get_collided_obstacle(row, column, frame_height, frame_width):
-            obstacles_in_last_collisions.append(collided)
-            # First show explosion, then show game over.
-            # To synchronize obstacle and spaceship explosions, start the latter one tick later.
-            await asyncio.sleep(0)
-            await explode(canvas, row + frame_height / 2, column + frame_width / 2)
-            finish_game(canvas)
-            return
-
-        draw_frame(canvas, row, column, frame)
-        if space_pressed and plasma_unblocked:
-            coroutines.append(fire(canvas, row, column + frame_width // 2, rows_speed=-2))
-        await asyncio.sleep(0)
-        draw_frame(canvas, row, column, frame, negative=True)
-
-
-async def fly_garbage(canvas, column, garbage_frame, speed=0.5):
-    """Animate garbage, flying from top to bottom. Сolumn position will stay same, as specified on start."""
-    rows_number, columns_number = canvas.getmaxyx()
-
-    column = max(column, 0)
-    column = min(column, columns_number - 1)
-    row = 0
-
-    frame_width, frame_height = get_frame_size(garbage_frame)
-    obstacle = Obstacle(row, column, frame_height, frame_width)
-    obstacles.append(obstacle)
-
-    while row < rows_number:
-        if obstacle in obstacles_in_last_collisions:
-            obstacles.remove(obstacle)
-            obstacles_in_last_collisions.remove(obstacle)
-            coroutines.append(explode(canvas, row + frame_height / 2, column + frame_width / 2))
-            return
-        draw_frame(canvas, row, column, garbage_frame)
-        await asyncio.sleep(0)
-        draw_frame(canvas, row, column, garbage_frame, negative=True)
-        row += speed
-        obstacle.row = row
-
-    obstacles.remove(obstacle)
-
-
-async def fill_orbit_with_garbage(canvas):
-    global coroutines
-    _, col_max = curses.window.getmaxyx(canvas)
-    while True:
-        delay_tics = get_garbage_delay_tics(year)
-        assert delay_tics is not None
-        await sleep(delay_tics)
-        garbage = choice(get_garbage_frames())
-        garbage_width, _ = get_frame_size(garbage)
-        column = randint(0, col_max - garbage_width)
-        coroutines.append(fly_garbage(canvas, column=column,
-                                      garbage_frame=garbage))
-
-
-async def show_gameover(canvas):
-    row_max, col_max = curses.window.getmaxyx(canvas)
-    frame = get_game_over_frame()
-    frame_width, frame_height = get_frame_size(frame)
-    row = row_max / 2 - frame_height / 2
-    column = col_max / 2 - frame_width / 2
+def setup_game(canvas, sub, stars_num=STARS_NUM, seed=None):
+    """Start a new game, canvas and sub are foreground layers of renderers."""
+    global game
+    # controls source is looked up on every read, so it can be wrapped after the game has started
+    game = Game(canvas, sub, lambda canvas: _read_controls(canvas), clock, stars_num, seed, immortal, profiler, hud,
+                scenario)
+    return game
 
-    while True:
-        draw_frame(canvas, row, column, frame)
-        await asyncio.sleep(0)
 
+def run_game(game, renderers, update_screen=curses.doupdate, stop=None, resize=None, screen_recorders=(),
+             key_events=None):
+    """Run game loop till all coroutines are finished or stop() returns True.
 
-async def blink(canvas, row, column, symbol='*', delay=0):
-    canvas.addstr(row, column, symbol, curses.A_DIM)
-    await sleep(delay)
+    resize() is called before every tick, it returns new windows when the screen has been resized.
+    Rendered frames are passed to screen_recorders, e.g. AsciicastRecorder or SpectatorFeed,
+    key_events is KeyEventQueue to measure input latency of.
+    """
+    clock, profiler = game.clock, game.profiler
+    clock.start()
     while True:
-        canvas.addstr(row, column, symbol)
-        await sleep(round(TIMES[1] / TIC_TIMEOUT))
-
-        canvas.addstr(row, column, symbol, curses.A_BOLD)
-        await sleep(round(TIMES[2] / TIC_TIMEOUT))
-
-        canvas.addstr(row, column, symbol)
-        await sleep(round(TIMES[3] / TIC_TIMEOUT))
-
-        canvas.addstr(row, column, symbol, curses.A_DIM)
-        await sleep(round(TIMES[0] / TIC_TIMEOUT))
-
-
-async def fire(canvas, start_row, start_column, rows_speed=-0.3, columns_speed=0):
-    """Display animation of gun shot, direction and speed can be specified."""
-
-    row, column = start_row, start_column
-
-    canvas.addstr(round(row), round(column), '*')
-    await asyncio.sleep(0)
-
-    canvas.addstr(round(row), round(column), 'O')
-    await asyncio.sleep(0)
-    canvas.addstr(round(row), round(column), ' ')
-
-    row += rows_speed
-    column += columns_speed
-
-    symbol = '-' if columns_speed else '|'
-
-    rows, columns = canvas.getmaxyx()
-    max_row, max_column = rows - 1, columns - 1
-
-    curses.beep()
-
-    while 0 < row < max_row and 0 < column < max_column:
-        if collided := get_collided_obstacle(round(row), round(column)):
-            obstacles_in_last_collisions.append(collided)
-            return
-        canvas.addstr(round(row), round(column), symbol)
-        await asyncio.sleep(0)
-        canvas.addstr(round(row), round(column), ' ')
-        row += rows_speed
-        column += columns_speed
-
-
-def collides_with_obstacle(obj_row, obj_column, obj_size_rows=1, obj_size_columns=1):
-    return any(obstacle.has_collision(obj_row, obj_column, obj_size_rows, obj_size_columns) for obstacle in obstacles)
-
-
-def get_collided_obstacle(obj_row, obj_column, obj_size_rows=1, obj_size_columns=1) -> Optional[Obstacle]:
-    for obstacle in obstacles:
-        if obstacle.has_collision(obj_row, obj_column, obj_size_rows, obj_size_columns):
-            return obstacle
-
-
-async def run_scenario(canvas, footer_canvas):
-    global year
-    year = 1957
-
-    while not game_over:
-        _show_year(footer_canvas, year)
-        if phrase := PHRASES.get(year):
-            show_phrase(footer_canvas, phrase, 40)
-        if year == 1961:
-            coroutines.append(fill_orbit_with_garbage(canvas))
-            # to visualize obstacle frames
-            # coroutines.append(show_obstacles(canvas, obstacles))
-        if year == 2025:
-            global plasma_unblocked
-            plasma_unblocked = True
-            show_phrase(footer_canvas, "Take the plasma gun! Shoot the garbage!", 999999)
-
-        await sleep(TICS_PER_YEAR)
-
-        year += 1
-
-
-def _show_year(canvas, _year):
-    _, col_max = curses.window.getmaxyx(canvas)
-    canvas.addstr(0, col_max - 12, f"Year: {_year}")
-
-
-async def _show_phrase(canvas, phrase, ticks):
-    sub_row_max, sub_col_max = curses.window.getmaxyx(canvas)
-
-    col = - len(phrase)
-    stop = (sub_col_max - len(phrase)) // 2
-
-    try:
-        while col < stop:
-            draw_frame(canvas, 0, col, phrase)
-            await asyncio.sleep(0)
-            draw_frame(canvas, 0, col, phrase, negative=True)
-            col += 6
-
-        draw_frame(canvas, 0, col, phrase)
-        await sleep(ticks)
-        draw_frame(canvas, 0, col, phrase, negative=True)
-    except asyncio.CancelledError:
-        draw_frame(canvas, 0, col, phrase, negative=True)
-        await asyncio.sleep(0)
-
-
-def show_phrase(canvas, phrase, ticks):
-    if last_phrase := getattr(show_phrase, 'last_phrase', None):
-        if last_phrase in coroutines:
-            last_phrase.throw(asyncio.CancelledError)
-    show_phrase.last_phrase = _show_phrase(canvas, phrase, ticks)
-    coroutines.append(show_phrase.last_phrase)
-
-
-def draw(stdscr):
-    curses.curs_set(False)
-
+        started_at = time.perf_counter()
+        if resize and (windows := resize()):
+            game.resize(*windows)
+            for screen_recorder in screen_recorders:
+                screen_recorder.resize(game.scheduler.tick * clock.tick_timeout, windows)
+        game.scheduler.run_tick()
+        if not game.scheduler or stop and stop():
+            break
+        render_started_at = time.perf_counter()
+        if clock.should_render():
+            runs = [renderer.flush() for renderer in renderers]
+            for screen_recorder in screen_recorders:
+                screen_recorder.record(game.scheduler.tick * clock.tick_timeout, runs)
+            update_screen()
+            if key_events is not None:
+                latencies = key_events.mark_displayed()
+                if profiler:
+                    profiler.add_input_latencies(latencies)
+        else:
+            for renderer in renderers:
+                renderer.skip()
+        if profiler:
+            finished_at = time.perf_counter()
+            profiler.add_tick(finished_at - started_at, finished_at - render_started_at,
+                              sum(renderer.writes for renderer in renderers))
+        for renderer in renderers:
+            renderer.writes = 0
+        clock.wait()
+
+
+def record_controls(path, game, stars_num):
+    """Write seed and every controls read by the game from now on to the file, so the game can be replayed."""
+    rows, columns = game.canvas.getmaxyx()
+    header = SessionHeader(game.seed, rows, columns, stars_num, game.immortal)
+    game.read_controls = recorder = ControlsRecorder(path, header, game.read_controls)
+    return recorder
+
+
+def layout_windows(rows, columns, create_window):
+    """Return game and footer windows of the screen made by create_window(rows, columns, begin_row, begin_column).
+
+    The game window is inside the screen border, the footer is below the line drawn above it, see `create_windows`.
+    """
+    return create_window(rows - 4, columns - 2, 1, 1), create_window(1, columns - 2, rows - 2, 1)
+
+
+def create_windows(stdscr):
+    """Draw the screen border and return game and footer windows fitting the screen."""
     stdscr_row_max, stdscr_col_max = curses.window.getmaxyx(stdscr)
     stdscr.border()
     stdscr.hline(stdscr_row_max - 3, 1, curses.ACS_HLINE, stdscr_col_max - 1)
@@ -312,41 +120,84 @@ def draw(stdscr):
     stdscr.addch(stdscr_row_max - 3, stdscr_col_max - 1, curses.ACS_SBSS)
     stdscr.refresh()
 
-    canvas = curses.newwin(stdscr_row_max - 4, stdscr_col_max - 2, 1, 1)
-    canvas.keypad(True)
-    canvas.nodelay(True)
+    canvas_window, sub_window = layout_windows(stdscr_row_max, stdscr_col_max, curses.newwin)
+    canvas_window.keypad(True)
+    canvas_window.nodelay(True)
+    return canvas_window, sub_window
 
-    sub = stdscr.derwin(1, stdscr_col_max - 2, stdscr_row_max - 2, 1)
 
-    row_max, col_max = curses.window.getmaxyx(canvas)
-    symbols = '+*.:'
+def _on_terminal_resize(signum, frame):
+    global terminal_resized
+    terminal_resized = True
 
-    global coroutines
-    coroutines = [blink(canvas,
-                        row=randint(1, row_max - 2),
-                        column=randint(1, col_max - 2),
-                        symbol=choice(symbols),
-                        delay=randint(0, round(1.0 / TIC_TIMEOUT))) for _ in range(STARS_NUM)]
 
-    coroutines.append(animate_spaceship(canvas,
-                                        row_max // 2,
-                                        col_max // 2,
-                                        {'basic': get_rocket_frames('basic'),
-                                         'plasma': get_rocket_frames('plasma')}))
+def resize_terminal(stdscr):
+    """Return new windows if the terminal has been resized since the previous call, otherwise None.
 
-    coroutines.append(run_scenario(canvas, sub))
+    Curses reports resize as KEY_RESIZE from getch, but getch isn't called with threaded input
+    or advanced control, so SIGWINCH is handled instead and curses is resized here.
+    """
+    global terminal_resized
+    if not terminal_resized:
+        return None
+    terminal_resized = False
 
-    while True:
-        for coroutine in coroutines.copy():
-            try:
-                coroutine.send(None)
-            except StopIteration:
-                coroutines.remove(coroutine)
-        if not coroutines:
-            break
-        canvas.refresh()
-        sub.refresh()
-        time.sleep(TIC_TIMEOUT)
+    columns, rows = os.get_terminal_size()
+    min_rows, min_columns = MIN_SCREEN_SIZE
+    if rows < min_rows or columns < min_columns:
+        return None
+    curses.resizeterm(rows, columns)
+    stdscr.clear()
+    return create_windows(stdscr)
+
+
+def draw(stdscr, stars_num=STARS_NUM):
+    curses.curs_set(False)
+
+    canvas_window, sub_window = create_windows(stdscr)
+
+    renderers = Renderer(canvas_window), Renderer(sub_window)
+    canvas, sub = renderers[0].foreground, renderers[1].foreground
+
+    global immortal, _read_controls
+    seed = None
+    if replay:
+        header = replay.header
+        if (header.rows, header.columns) != canvas.getmaxyx():
+            raise SystemExit(f'Replay needs {header.rows + 4}x{header.columns + 2} terminal')
+        seed, stars_num, immortal = header.seed, header.stars_num, header.immortal
+        _read_controls = replay
+
+    game = setup_game(canvas, sub, stars_num, seed)
+
+    key_events = None
+    # rendered frames are passed to them: AsciicastRecorder of --record, SpectatorFeed of --spectate
+    screen_recorders = []
+    # resources already started are closed if starting the next one fails
+    with ExitStack() as stack:
+        if threaded_input:
+            key_events = KeyEventQueue()
+            key_reader = TerminalKeyReader(key_events)
+            _read_controls = key_events.read_controls
+            key_reader.start()
+            stack.callback(key_reader.stop)
+        recorder = record_input_path and record_controls(record_input_path, game, stars_num)
+        if recorder:
+            stack.callback(recorder.close)
+        # replay needs the screen size the game was recorded with
+        resize = None
+        if not replay and not recorder:
+            signal.signal(signal.SIGWINCH, _on_terminal_resize)
+            resize = lambda: resize_terminal(stdscr)  # noqa: E731
+        if record_path:
+            screen_recorders.append(AsciicastRecorder(record_path, (canvas_window, sub_window),
+                                                      title='Async Console Game'))
+            stack.callback(screen_recorders[-1].close)
+        if spectate_port:
+            screen_recorders.append(SpectatorFeed((canvas_window, sub_window), spectate_port,
+                                                  compress=spectate_compress))
+            stack.callback(screen_recorders[-1].close)
+        run_game(game, renderers, resize=resize, screen_recorders=screen_recorders, key_events=key_events)
 
     time.sleep(5)
 
@@ -360,12 +211,44 @@ def signal_handler(signal, frame):
     sys.exit(0)
 
 
+def add_game_arguments(parser):
+    """Add options of the game itself, headless runs take them too."""
+    parser.add_argument('--assets-bundle', default=None,
+                        help='Load frames from bundle packed with `python3 assets.py FILE` instead of frames/')
+    parser.add_argument('--stars', type=int, default=STARS_NUM,
+                        help='Number of stars in the sky')
+    parser.add_argument('--immortal', action='store_true', default=False,
+                        help="Spaceship doesn't collide with garbage")
+    parser.add_argument('--record-input', default=None,
+                        help='Record seed and controls of the game to binary file for replay')
+    parser.add_argument('--record', default=None,
+                        help='Record the screen to asciicast v2 file, play it with `asciinema play FILE`')
+    parser.add_argument('--replay', default=None,
+                        help='Replay game recorded with --record-input')
+    parser.add_argument('--scenario', default=None,
+                        help='Play scenario from JSON file, see scenario.json. '
+                             'Replays need the same --scenario as the recorded game')
+    parser.add_argument('--hud', action='store_true', default=False,
+                        help='Show tick timings in the footer')
+    parser.add_argument('--profile', default=None,
+                        help='Profile game loop and save tick timings by coroutine to JSON file on exit')
+
+
 def create_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description='Funny console game'
     )
     parser.add_argument('-a', '--advanced-control', action='store_true', default=False,
                         help='Use keyboard monitor to provide advanced spaceship control (experimental)')
+    parser.add_argument('--stats', action='store_true', default=False,
+                        help='Print game loop timing stats on exit')
+    parser.add_argument('--threaded-input', action='store_true', default=False,
+                        help='Read keys from the terminal in a background thread and timestamp them')
+    parser.add_argument('--spectate', type=int, default=None, metavar='PORT',
+                        help='Stream the game to spectators on local PORT, watch with `python3 spectator.py PORT`')
+    parser.add_argument('--spectate-compress', action='store_true', default=False,
+                        help='Compress frames streamed to spectators with zlib')
+    add_game_arguments(parser)
     return parser
 
 
@@ -375,14 +258,37 @@ if __name__ == '__main__':
 
     arg_parser = create_parser()
     args = arg_parser.parse_args()
+    load_assets(args.assets_bundle)
+    immortal = args.immortal
+    hud = args.hud
+    if args.scenario:
+        scenario = load_scenario(args.scenario)
+    threaded_input = args.threaded_input and not args.advanced_control and not args.replay
+    record_input_path = args.record_input
+    record_path = args.record
+    spectate_port = args.spectate
+    spectate_compress = args.spectate_compress
+    if args.replay:
+        replay = ControlsReplay(args.replay)
+    if args.hud or args.profile:
+        profiler = TickProfiler()
     if args.advanced_control:
-        from keyboard_tools import read_controls as read_controls_advanced, stop_controls_reading
+        from keyboard_tools import (read_controls as read_controls_advanced, start_controls_reading,
+                                    stop_controls_reading)
 
         def _read_controls_advanced(canvas):
             return read_controls_advanced()
 
         _read_controls = _read_controls_advanced
         _tear_down = stop_controls_reading
+        start_controls_reading()
 
     curses.update_lines_cols()
-    curses.wrapper(draw)
+    try:
+        curses.wrapper(draw, stars_num=args.stars)
+    finally:
+        _tear_down()
+        if args.stats:
+            print(clock.report(), file=sys.stderr)
+        if args.profile:
+            profiler.dump(args.profile)
@@ -1,20 +1,36 @@
 import logging
 import signal
-from multiprocessing import Process, Pipe
-
-from pynput import keyboard
+import struct
+from importlib.util import find_spec
+from multiprocessing import Process
+from multiprocessing.shared_memory import SharedMemory
 
 
 logging.disable(logging.WARN)
 
+CONTROL_KEYS = ('left', 'right', 'up', 'down', 'space')
+
+# shared control state: sequence number, incremented before and after every change, and key bits
+STATE_FORMAT = '=IB'
+STATE_SIZE = struct.calcsize(STATE_FORMAT)
+SEQUENCE_FORMAT = '=I'
+BITS_FORMAT = '=B'
+BITS_OFFSET = struct.calcsize(SEQUENCE_FORMAT)
+# reader gives up after this number of torn reads, the state is read again on the next call
+MAX_READ_ATTEMPTS = 100
+
 
 class KeyMonitor:
 
     state = {'left': False, 'right': False, 'up': False, 'down': False, 'space': False}
-    keys_map = {keyboard.Key.left: 'left', keyboard.Key.right: 'right', keyboard.Key.up: 'up',
-                keyboard.Key.down: 'down', keyboard.Key.space: 'space'}
 
     def __init__(self, on_control_keys_change):
+        # pynput is imported in the monitor process only, the game doesn't need it
+        from pynput import keyboard
+
+        self._keyboard = keyboard
+        self.keys_map = {keyboard.Key.left: 'left', keyboard.Key.right: 'right', keyboard.Key.up: 'up',
+                         keyboard.Key.down: 'down', keyboard.Key.space: 'space'}
         self._on_control_keys_change = on_control_keys_change
         self.listener = None
 
@@ -37,7 +53,7 @@ class KeyMonitor:
             pass
 
     def run(self):
-        with keyboard.Listener(
+        with self._keyboard.Listener(
                 on_press=self.on_press,
                 on_release=self.on_release) as listener:
             self.listener = listener
@@ -47,16 +63,93 @@ class KeyMonitor:
         self.listener.stop()
 
 
+def pack_keys(state):
+    bits = 0
+    for bit, key_name in enumerate(CONTROL_KEYS):
+        if state[key_name]:
+            bits |= 1 << bit
+    return bits
+
+
+def unpack_keys(bits):
+    return {key_name: bool(bits & 1 << bit) for bit, key_name in enumerate(CONTROL_KEYS)}
+
+
+class SharedControlState:
+    """Control keys state in shared memory, written by the monitor process and read by the game.
+
+    Reading takes a single struct unpack, no pipes and pickling. The sequence number tells if the state has changed,
+    it works as a seqlock: it is odd while the writer changes the bits, so the reader retries if the sequence is odd
+    or has changed while the bits were read.
+    """
+
+    def __init__(self, name=None):
+        if name is None:
+            self._memory = SharedMemory(create=True, size=STATE_SIZE)
+            self._owner = True
+        else:
+            # the monitor process shares the resource tracker of the game, which unlinks memory left by a crash
+            self._memory = SharedMemory(name=name)
+            self._owner = False
+        self.name = self._memory.name
+        self._sequence = 0
+
+    def write(self, state):
+        buffer = self._memory.buf
+        sequence, = struct.unpack_from(SEQUENCE_FORMAT, buffer)
+        struct.pack_into(SEQUENCE_FORMAT, buffer, 0, (sequence + 1) & 0xFFFFFFFF)
+        struct.pack_into(BITS_FORMAT, buffer, BITS_OFFSET, pack_keys(state))
+        struct.pack_into(SEQUENCE_FORMAT, buffer, 0, (sequence + 2) & 0xFFFFFFFF)
+
+    def read(self):
+        """Return packed key bits if the state has changed since the previous read, otherwise None."""
+
+        buffer = self._memory.buf
+        for _ in range(MAX_READ_ATTEMPTS):
+            sequence, bits = struct.unpack_from(STATE_FORMAT, buffer)
+            if sequence == self._sequence:
+                return None
+            if sequence & 1 or struct.unpack_from(SEQUENCE_FORMAT, buffer)[0] != sequence:
+                continue
+            self._sequence = sequence
+            return bits
+        return None
+
+    def close(self):
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+def _monitor_control_keys(state_name):
+    shared_state = SharedControlState(state_name)
+    monitor = KeyMonitor(shared_state.write)
+    signal.signal(signal.SIGTERM, _sigterm_handler(monitor))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    monitor.run()
+    shared_state.close()
+
+
+def _sigterm_handler(monitor):
+    def sigterm_handler(sig, frame):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        monitor.stop()
+    return sigterm_handler
+
+
 class Monitor:
     def __init__(self):
         self.p = None
-        self.conn = None
+        self.state = None
 
     def start(self):
-        self.conn, c_conn = Pipe()
-        self.p = Process(target=self.monitor_control_keys, args=(c_conn,))
+        """Start monitor process, it doesn't wait for the process, keys are just not pressed until it's ready."""
+
+        if find_spec('pynput') is None:
+            raise ImportError('pynput is required for advanced control, see requirements.txt')
+        self.state = SharedControlState()
+        self.p = Process(target=_monitor_control_keys, args=(self.state.name,), daemon=True)
         self.p.start()
-        c_conn.close()
 
     def stop(self):
         # first try to exit gracefully (via custom sigterm handler)
@@ -66,21 +159,10 @@ class Monitor:
         if self.p.exitcode is None:
             self.p.terminate()
             self.p.join()
-
-    def monitor_control_keys(self, conn):
-        monitor = KeyMonitor(lambda state: conn.send(state))
-        signal.signal(signal.SIGTERM, self._sigterm_handler(monitor))
-        signal.signal(signal.SIGINT, signal.SIG_IGN)
-        monitor.run()
-
-    def _sigterm_handler(self, monitor):
-        def sigterm_handler(sig, frame):
-            signal.signal(signal.SIGTERM, signal.SIG_DFL)
-            monitor.stop()
-        return sigterm_handler
+        self.state.close()
 
     def get_control_keys(self):
-        keys = None
-        while self.conn.poll():
-            keys = self.conn.recv()
-        return keys
+        bits = self.state.read()
+        if bits is None:
+            return None
+        return unpack_keys(bits)
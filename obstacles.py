@@ -1,15 +1,33 @@
-import asyncio
+from collections import defaultdict
+from functools import lru_cache
+from itertools import count
+from math import ceil
+
 from curses_tools import draw_frame
+from scheduler import next_tick
 
 
 class Obstacle:
-    
-    def __init__(self, row, column, rows_size=1, columns_size=1, uid=None):
+
+    __slots__ = ('row', 'column', 'rows_size', 'columns_size', 'uid', 'mask', 'hit', 'previous_row', 'previous_column')
+
+    def __init__(self, row, column, rows_size=1, columns_size=1, uid=None, mask=None):
+        self.reset(row, column, rows_size, columns_size, uid, mask)
+
+    def reset(self, row, column, rows_size=1, columns_size=1, uid=None, mask=None):
+        """Reinitialize obstacle taken from a pool."""
         self.row = row
         self.column = column
         self.rows_size = rows_size
         self.columns_size = columns_size
         self.uid = uid
+        # occupancy bitmask of the frame, see curses_tools.Sprite, None means the whole box is solid
+        self.mask = mask
+        # hit since the last ObstaclesGrid.drain_hits
+        self.hit = False
+        # position before the last move, for swept collision tests
+        self.previous_row = row
+        self.previous_column = column
     
     def get_bounding_box_frame(self):
         # increment box size to compensate obstacle movement
@@ -23,15 +41,52 @@ class Obstacle:
         row, column = self.get_bounding_box_corner_pos()
         return row, column, self.get_bounding_box_frame()
         
-    def has_collision(self, obj_corner_row, obj_corner_column, obj_size_rows=1, obj_size_columns=1):
-        """Determine if collision has occured. Return True or False."""
-        return has_collision(
+    def has_collision(self, obj_corner_row, obj_corner_column, obj_size_rows=1, obj_size_columns=1, obj_mask=None):
+        """Determine if collision has occured. Return True or False.
+
+        If obstacle or object has a mask, only their non-blank cells collide.
+        """
+        if self.mask is None and obj_mask is None:
+            return has_collision(
+                (self.row, self.column),
+                (self.rows_size, self.columns_size),
+                (obj_corner_row, obj_corner_column),
+                (obj_size_rows, obj_size_columns),
+            )
+        return has_mask_collision(
             (self.row, self.column),
             (self.rows_size, self.columns_size),
+            self.mask,
             (obj_corner_row, obj_corner_column),
             (obj_size_rows, obj_size_columns),
+            obj_mask,
         )
 
+    def has_swept_collision(self, start_row, start_column, end_row, end_column, obj_size_rows=1, obj_size_columns=1,
+                            obj_mask=None):
+        """Determine if object moving from start to end corner has collided on the way. Return True or False.
+
+        Obstacle move from its previous position is taken into account, so both may move fast.
+        If obstacle or object has a mask, the path is walked cell by cell once the boxes collide.
+        """
+        start_row += self.row - self.previous_row
+        start_column += self.column - self.previous_column
+        corner, size = (self.row, self.column), (self.rows_size, self.columns_size)
+        obj_size = obj_size_rows, obj_size_columns
+
+        if not has_swept_collision(corner, size, (start_row, start_column), (end_row, end_column), obj_size):
+            return False
+        if self.mask is None and obj_mask is None:
+            return True
+
+        rows_move, columns_move = end_row - start_row, end_column - start_column
+        steps = max(ceil(abs(rows_move)), ceil(abs(columns_move)), 1)
+        for step in range(steps + 1):
+            obj_corner = start_row + rows_move * step / steps, start_column + columns_move * step / steps
+            if has_mask_collision(corner, size, self.mask, obj_corner, obj_size, obj_mask):
+                return True
+        return False
+
 
 def _get_bounding_box_lines(rows, columns):
 
@@ -45,18 +100,11 @@ async def show_obstacles(canvas, obstacles):
     """Display bounding boxes of every obstacle in a list"""
     
     while True:
-        boxes = []
-
         for obstacle in obstacles:
-            boxes.append(obstacle.dump_bounding_box())
-        
-        for row, column, frame in boxes:
+            row, column, frame = obstacle.dump_bounding_box()
             draw_frame(canvas, row, column, frame)
 
-        await asyncio.sleep(0)
-
-        for row, column, frame in boxes:
-            draw_frame(canvas, row, column, frame, negative=True)
+        await next_tick()
 
 
 def _is_point_inside(corner_row, corner_column, size_rows, size_columns, point_row, point_row_column):
@@ -79,10 +127,181 @@ def has_collision(obstacle_corner, obstacle_size, obj_corner, obj_size=(1, 1)):
         obj_corner[1] + obj_size[1] - 1,
     )
 
-    return any([
-        _is_point_inside(*obstacle_corner, *obstacle_size, *obj_corner),
-        _is_point_inside(*obstacle_corner, *obstacle_size, *opposite_obj_corner),
+    # plain `or` stops at the first hit and doesn't build a temporary list on every check
+    return (
+        _is_point_inside(*obstacle_corner, *obstacle_size, *obj_corner)
+        or _is_point_inside(*obstacle_corner, *obstacle_size, *opposite_obj_corner)
+
+        or _is_point_inside(*obj_corner, *obj_size, *obstacle_corner)
+        or _is_point_inside(*obj_corner, *obj_size, *opposite_obstacle_corner)
+    )
+
+
+@lru_cache(maxsize=64)
+def get_box_mask(rows, columns):
+    """Return mask of solid box."""
+
+    return ((1 << columns) - 1,) * rows
+
+
+def has_mask_collision(obstacle_corner, obstacle_size, obstacle_mask, obj_corner, obj_size=(1, 1), obj_mask=None):
+    """Determine if non-blank cells of obstacle and object overlap. Return True or False.
+
+    Masks are tuples of ints, one per row, bit N is set when cell N of the row isn't blank, None means solid box.
+    Corners are rounded to cells the same way sprites are drawn, boxes are tested before masks.
+    """
+
+    row_offset = round(obj_corner[0]) - round(obstacle_corner[0])
+    column_offset = round(obj_corner[1]) - round(obstacle_corner[1])
+    obstacle_rows, obstacle_columns = obstacle_size
+    obj_rows, obj_columns = obj_size
+    if not (-obj_rows < row_offset < obstacle_rows and -obj_columns < column_offset < obstacle_columns):
+        return False
+
+    if obstacle_mask is None:
+        obstacle_mask = get_box_mask(obstacle_rows, obstacle_columns)
+    if obj_mask is None:
+        obj_mask = get_box_mask(obj_rows, obj_columns)
+    for row in range(max(row_offset, 0), min(len(obstacle_mask), row_offset + len(obj_mask))):
+        bits = obj_mask[row - row_offset]
+        bits = bits << column_offset if column_offset >= 0 else bits >> -column_offset
+        if bits & obstacle_mask[row]:
+            return True
+    return False
+
+
+def has_swept_collision(obstacle_corner, obstacle_size, obj_start, obj_end, obj_size=(1, 1)):
+    """Determine if object moving straight from start to end corner collides with static obstacle on the way.
+
+    Ray versus box test (slab method): the path of object corner is clipped by obstacle box grown by object size.
+    Unlike has_collision at the end position, fast objects can't tunnel through thin obstacles.
+    Return True or False.
+    """
+
+    enter, leave = 0.0, 1.0
+    for corner, size, start, end, obj_size_ in zip(obstacle_corner, obstacle_size, obj_start, obj_end, obj_size):
+        # boxes overlap when object corner is strictly between low and high
+        low, high = corner - obj_size_, corner + size
+        # the whole path is on one side of the obstacle, most tests end here
+        if start <= low and end <= low or start >= high and end >= high:
+            return False
+        move = end - start
+        if not move:
+            continue
+        low_time, high_time = (low - start) / move, (high - start) / move
+        enter = max(enter, min(low_time, high_time))
+        leave = min(leave, max(low_time, high_time))
+
+    return enter < leave
+
+
+class ObstaclesGrid:
+    """Registry of obstacles indexed by uid and by uniform grid (spatial hash).
+
+    Every obstacle is put into all cells its bounding box touches, so a collision lookup only has to check
+    obstacles from the cells around the object instead of the whole list. Iterating the grid yields
+    all obstacles in the order they were added, so it can be used wherever a plain list was used before.
+    Obstacles without uid get one when added. Obstacles hit during a tick are marked with `mark_hit`
+    and collected in bulk with `drain_hits`, all bookkeeping is O(1) per obstacle.
+    """
+
+    def __init__(self, cell_size=8):
+        self.cell_size = cell_size
+        self._cells = defaultdict(dict)
+        self._obstacles = {}
+        self._obstacle_cells = {}
+        self._hits = {}
+        self._uids = count(1)
+
+    def __iter__(self):
+        return iter(list(self._obstacles.values()))
+
+    def __len__(self):
+        return len(self._obstacles)
+
+    def __contains__(self, obstacle):
+        return self._obstacles.get(obstacle.uid) is obstacle
+
+    def get(self, uid):
+        return self._obstacles.get(uid)
+
+    def mark_hit(self, obstacle):
+        if obstacle.hit:
+            return
+        obstacle.hit = True
+        self._hits[obstacle.uid] = obstacle
+
+    def drain_hits(self):
+        """Return obstacles hit since the previous call and still in the grid, in order of hits."""
+
+        hits = list(self._hits.values())
+        self._hits.clear()
+        for obstacle in hits:
+            obstacle.hit = False
+        return hits
+
+    def _get_cells(self, row, column, rows_size, columns_size):
+        cell_size = self.cell_size
+        first_row, last_row = int(row // cell_size), int((row + rows_size) // cell_size)
+        first_column, last_column = int(column // cell_size), int((column + columns_size) // cell_size)
+        return first_row, last_row, first_column, last_column
+
+    def add(self, obstacle):
+        if obstacle.uid is None:
+            obstacle.uid = next(self._uids)
+        cells = self._get_cells(obstacle.row, obstacle.column, obstacle.rows_size, obstacle.columns_size)
+        self._obstacles[obstacle.uid] = obstacle
+        self._obstacle_cells[obstacle.uid] = cells
+        self._fill_cells(obstacle, cells)
+
+    def remove(self, obstacle):
+        del self._obstacles[obstacle.uid]
+        cells = self._obstacle_cells.pop(obstacle.uid)
+        self._hits.pop(obstacle.uid, None)
+        obstacle.hit = False
+        self._clear_cells(obstacle, cells)
+
+    def move(self, obstacle):
+        """Update obstacle cells after its row or column was changed."""
+
+        old_cells = self._obstacle_cells[obstacle.uid]
+        cells = self._get_cells(obstacle.row, obstacle.column, obstacle.rows_size, obstacle.columns_size)
+        if cells == old_cells:
+            return
+        self._clear_cells(obstacle, old_cells)
+        self._obstacle_cells[obstacle.uid] = cells
+        self._fill_cells(obstacle, cells)
+
+    def get_nearby(self, obj_corner_row, obj_corner_column, obj_size_rows=1, obj_size_columns=1):
+        """Return obstacles from cells touched by the object box, without duplicates."""
+
+        first_row, last_row, first_column, last_column = self._get_cells(
+            obj_corner_row, obj_corner_column, obj_size_rows, obj_size_columns)
+        cells = self._cells
+
+        if first_row == last_row and first_column == last_column:
+            cell = cells.get((first_row, first_column))
+            return list(cell.values()) if cell else []
+
+        nearby = {}
+        for cell_row in range(first_row, last_row + 1):
+            for cell_column in range(first_column, last_column + 1):
+                cell = cells.get((cell_row, cell_column))
+                if cell:
+                    nearby.update(cell)
+        return list(nearby.values())
+
+    def _fill_cells(self, obstacle, cells):
+        first_row, last_row, first_column, last_column = cells
+        for cell_row in range(first_row, last_row + 1):
+            for cell_column in range(first_column, last_column + 1):
+                self._cells[cell_row, cell_column][obstacle.uid] = obstacle
 
-        _is_point_inside(*obj_corner, *obj_size, *obstacle_corner),
-        _is_point_inside(*obj_corner, *obj_size, *opposite_obstacle_corner),
-    ])
+    def _clear_cells(self, obstacle, cells):
+        first_row, last_row, first_column, last_column = cells
+        for cell_row in range(first_row, last_row + 1):
+            for cell_column in range(first_column, last_column + 1):
+                cell = self._cells[cell_row, cell_column]
+                del cell[obstacle.uid]
+                if not cell:
+                    del self._cells[cell_row, cell_column]
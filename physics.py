@@ -57,7 +57,7 @@ def update_speed(row_speed, column_speed, rows_direction, columns_direction, row
         raise ValueError(f'Wrong columns_direction value {columns_direction}. Expects -1, 0 or 1.')
     
     if fading < 0 or fading > 1:
-        raise ValueError(f'Wrong columns_direction value {fading}. Expects float between 0 and 1.')
+        raise ValueError(f'Wrong fading value {fading}. Expects float between 0 and 1.')
 
     # гасим скорость, чтобы корабль останавливался со временем
     row_speed *= fading
@@ -72,3 +72,24 @@ def update_speed(row_speed, column_speed, rows_direction, columns_direction, row
         column_speed = _apply_acceleration(column_speed, column_speed_limit, columns_direction > 0)
 
     return row_speed, column_speed
+
+
+def bound_move(row, column, row_speed, column_speed, row_max, column_max):
+    if row <= 0:
+        row = 0
+        row_speed = 0
+
+    if row >= row_max:
+        row = row_max
+        row_speed = 0
+
+    if column <= 0:
+        column = 0
+        column_speed = 0
+
+    if column >= column_max:
+        column = column_max
+        column_speed = 0
+
+    return row, column, row_speed, column_speed
+
@@ -0,0 +1,37 @@
+class Pool:
+    """Free list of reusable objects, released objects are reset and handed out again instead of new ones.
+
+    New objects are created as factory(*args), reused ones get reset(*args) called.
+    """
+
+    def __init__(self, factory, max_size=1024):
+        self.factory = factory
+        self.max_size = max_size
+        self.created = 0
+        self.reused = 0
+        self._free = []
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self, *args):
+        if not self._free:
+            self.created += 1
+            return self.factory(*args)
+        self.reused += 1
+        item = self._free.pop()
+        item.reset(*args)
+        return item
+
+    def release(self, item):
+        if len(self._free) < self.max_size:
+            self._free.append(item)
+
+    def stats(self):
+        acquired = self.created + self.reused
+        return {
+            'free': len(self._free),
+            'created': self.created,
+            'reused': self.reused,
+            'hit_rate': self.reused / acquired if acquired else 0,
+        }
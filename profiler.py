@@ -0,0 +1,93 @@
+import json
+from collections import defaultdict, deque
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class TickProfiler:
+    """Collects durations of game loop ticks, coroutine steps grouped by coroutine function, and rendering.
+
+    Steps of the entities and the explosions, which do the work of many coroutines at once, report their phases.
+    """
+
+    def __init__(self, recent_ticks=100):
+        self.tick_durations = []
+        self.render_durations = []
+        self.writes = []
+        self.input_latencies = []
+        # coroutine function name -> [steps number, total seconds]
+        self.steps = defaultdict(lambda: [0, 0.0])
+        # phase name -> [calls number, total seconds]
+        self.phases = defaultdict(lambda: [0, 0.0])
+        # callable returning {pool name: usage stats}, included in the summary
+        self.pool_stats = None
+        self._recent_durations = deque(maxlen=recent_ticks)
+
+    def add_step(self, name, duration):
+        step = self.steps[name]
+        step[0] += 1
+        step[1] += duration
+
+    def add_phase(self, name, duration):
+        phase = self.phases[name]
+        phase[0] += 1
+        phase[1] += duration
+
+    def add_tick(self, duration, render_duration, writes):
+        self.tick_durations.append(duration)
+        self.render_durations.append(render_duration)
+        self.writes.append(writes)
+        self._recent_durations.append(duration)
+
+    def add_input_latencies(self, latencies):
+        self.input_latencies.extend(latencies)
+
+    def get_hud_text(self):
+        """Short summary of recent ticks for on-screen display."""
+
+        recent = self._recent_durations
+        return f'tick p50 {percentile(recent, 0.5) * 1000:.1f}ms p99 {percentile(recent, 0.99) * 1000:.1f}ms'
+
+    def summary(self):
+        total = sum(self.tick_durations)
+        return {
+            'ticks': len(self.tick_durations),
+            'tick_p50_ms': percentile(self.tick_durations, 0.5) * 1000,
+            'tick_p99_ms': percentile(self.tick_durations, 0.99) * 1000,
+            'tick_max_ms': max(self.tick_durations, default=0) * 1000,
+            'render_p50_ms': percentile(self.render_durations, 0.5) * 1000,
+            'render_p99_ms': percentile(self.render_durations, 0.99) * 1000,
+            'writes_per_tick_p50': percentile(self.writes, 0.5),
+            'writes_per_tick_p99': percentile(self.writes, 0.99),
+            'input_events': len(self.input_latencies),
+            'input_latency_p50_ms': percentile(self.input_latencies, 0.5) * 1000,
+            'input_latency_p99_ms': percentile(self.input_latencies, 0.99) * 1000,
+            'coroutines': {
+                name: {
+                    'steps': steps,
+                    'total_ms': seconds * 1000,
+                    'mean_us': seconds / steps * 1e6,
+                    'share': seconds / total if total else 0,
+                }
+                for name, (steps, seconds) in sorted(self.steps.items(), key=lambda item: -item[1][1])
+            },
+            'phases': {
+                name: {
+                    'calls': calls,
+                    'total_ms': seconds * 1000,
+                    'mean_us': seconds / calls * 1e6,
+                    'share': seconds / total if total else 0,
+                }
+                for name, (calls, seconds) in sorted(self.phases.items(), key=lambda item: -item[1][1])
+            },
+            'pools': self.pool_stats() if self.pool_stats else {},
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
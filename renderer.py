@@ -0,0 +1,151 @@
+import curses
+
+BLANK = (' ', 0)
+
+
+class Layer:
+    """Drawing surface of the renderer, mimics the part of curses window interface used by the game.
+
+    Cells of a persistent layer stay on screen until overwritten, cells of a non-persistent layer
+    live for a single tick only, so moving things don't have to erase themselves.
+    """
+
+    def __init__(self, renderer, persistent):
+        self.renderer = renderer
+        self.persistent = persistent
+        self.cells = {}
+
+    def getmaxyx(self):
+        return self.renderer.rows, self.renderer.columns
+
+    def getch(self):
+        return self.renderer.window.getch()
+
+    def addstr(self, row, column, text, attr=0):
+        renderer = self.renderer
+        renderer.writes += 1
+        if not 0 <= row < renderer.rows:
+            return
+
+        cells = self.cells
+        dirty = renderer.dirty if self.persistent else None
+        columns = renderer.columns
+        for column, symbol in enumerate(text, column):
+            if column < 0:
+                continue
+            if column >= columns:
+                break
+            cell = symbol, attr
+            if self.persistent:
+                if cell == BLANK:
+                    cells.pop((row, column), None)
+                else:
+                    cells[row, column] = cell
+                dirty.add((row, column))
+            else:
+                cells[row, column] = cell
+
+    def addch(self, row, column, symbol, attr=0):
+        self.addstr(row, column, symbol, attr)
+
+
+class Renderer:
+    """Double-buffered renderer of a curses window.
+
+    Coroutines draw into `background` (persistent) and `foreground` (cleared every tick) layers.
+    `flush` composes the back buffer from both layers, compares it with the front buffer — what is
+    on the screen now — and pushes only changed cells to the window with noutrefresh.
+    Call curses.doupdate() once after flushing all renderers.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.rows, self.columns = window.getmaxyx()
+        self.background = Layer(self, persistent=True)
+        self.foreground = Layer(self, persistent=False)
+        self.dirty = set()
+        # number of addstr/addch calls to layers, the profiler resets it every tick
+        self.writes = 0
+        self._front = {}
+        self._last_foreground = {}
+
+    def flush(self):
+        """Push changed cells to the window, return changed runs as (row, column, text, attr)."""
+
+        foreground = self.foreground.cells
+        background = self.background.cells
+        front = self._front
+
+        dirty = self.dirty
+        dirty.update(foreground)
+        dirty.update(self._last_foreground)
+
+        changed = []
+        for cell in dirty:
+            value = foreground.get(cell) or background.get(cell, BLANK)
+            if front.get(cell, BLANK) == value:
+                continue
+            if value == BLANK:
+                del front[cell]
+            else:
+                front[cell] = value
+            changed.append((cell, value))
+        dirty.clear()
+
+        # swap foreground buffers, the previous one is needed to erase what is not drawn anymore
+        self._last_foreground = foreground
+        self.foreground.cells = {}
+
+        runs = get_runs(changed)
+        for row, column, text, attr in runs:
+            try:
+                self.window.addstr(row, column, text, attr)
+            except curses.error:
+                # writing to the lower right corner moves cursor out of the window, text is drawn anyway
+                pass
+        self.window.noutrefresh()
+        return runs
+
+    def skip(self):
+        """Drop the foreground of a tick which is not rendered, the last flushed one is kept to be erased."""
+
+        self.foreground.cells = {}
+
+    def resize(self, window):
+        """Switch to a window of the new size, layers are kept but cleared, so their owners have to redraw."""
+
+        self.window = window
+        self.rows, self.columns = window.getmaxyx()
+        self.background.cells = {}
+        self.foreground.cells = {}
+        self.dirty.clear()
+        self._last_foreground = {}
+        self._front.clear()
+        window.erase()
+
+    def invalidate(self):
+        """Forget what is on the screen, next flush will redraw every non-blank cell."""
+
+        self.window.erase()
+        self._front.clear()
+        self.dirty.update(self.background.cells)
+        self.dirty.update(self._last_foreground)
+
+
+def get_runs(changed):
+    """Join changed cells into runs of neighbour cells of the same row with the same attributes."""
+
+    runs = []
+    run_row = run_column = run_attr = None
+    run_symbols = []
+    for (row, column), (symbol, attr) in sorted(changed):
+        if row == run_row and attr == run_attr and column == run_column + len(run_symbols):
+            run_symbols.append(symbol)
+            continue
+        if run_symbols:
+            runs.append((run_row, run_column, ''.join(run_symbols), run_attr))
+        run_row, run_column, run_attr = row, column, attr
+        run_symbols = [symbol]
+    if run_symbols:
+        runs.append((run_row, run_column, ''.join(run_symbols), run_attr))
+    return runs
@@ -0,0 +1,68 @@
+import struct
+from collections import namedtuple
+
+MAGIC = b'ACGR'
+VERSION = 1
+HEADER_FORMAT = '>4sBQHHIB'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# everything what makes the game run the same way, besides controls
+SessionHeader = namedtuple('SessionHeader', ['seed', 'rows', 'columns', 'stars_num', 'immortal'])
+
+
+def pack_controls(rows_direction, columns_direction, space_pressed):
+    """Pack controls tuple into a byte: 2 bits per direction, 1 bit for space."""
+
+    return (rows_direction + 1) | (columns_direction + 1) << 2 | bool(space_pressed) << 4
+
+
+def unpack_controls(packed):
+    return (packed & 0b11) - 1, (packed >> 2 & 0b11) - 1, bool(packed >> 4 & 1)
+
+
+class ControlsRecorder:
+    """Wrapper of controls source, which writes session header and then every controls tuple read to binary log."""
+
+    def __init__(self, path, header, read_controls):
+        self.header = header
+        self._read_controls = read_controls
+        self._file = open(path, 'wb')
+        self._file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, header.seed, header.rows, header.columns,
+                                     header.stars_num, header.immortal))
+
+    def __call__(self, canvas):
+        controls = self._read_controls(canvas)
+        self._file.write(bytes((pack_controls(*controls),)))
+        return controls
+
+    def close(self):
+        self._file.close()
+
+
+class ControlsReplay:
+    """Source of controls, which returns controls from binary log in order they were recorded.
+
+    When log is over, `finished` is set and no keys are pressed.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, *header = struct.unpack_from(HEADER_FORMAT, data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a game session record of version {VERSION}')
+        self.header = SessionHeader(*header[:-1], bool(header[-1]))
+        self._controls = data[HEADER_SIZE:]
+        self._position = 0
+        self.finished = not self._controls
+
+    def __len__(self):
+        return len(self._controls)
+
+    def __call__(self, canvas):
+        if self._position >= len(self._controls):
+            self.finished = True
+            return 0, 0, False
+        controls = unpack_controls(self._controls[self._position])
+        self._position += 1
+        return controls
@@ -0,0 +1,227 @@
+import asyncio
+import time
+
+
+class TickClock:
+    """Fixed-timestep clock of the game loop.
+
+    The clock measures how long a tick took and sleeps only for the time left till the next tick,
+    so the game keeps its pace under load. When the loop falls behind, rendering of some ticks may be
+    skipped (simulation still runs) to catch up. Late ticks and skipped frames are counted.
+    """
+
+    def __init__(self, tick_timeout, max_skipped_frames=5, realtime=True, timer=time.perf_counter, sleeper=time.sleep):
+        self.tick_timeout = tick_timeout
+        self.max_skipped_frames = max_skipped_frames
+        self.realtime = realtime
+        self.tick = 0
+        self.late_ticks = 0
+        self.skipped_frames = 0
+        self._timer = timer
+        self._sleeper = sleeper
+        self._deadline = None
+        self._skipped_in_row = 0
+
+    def seconds_to_tics(self, seconds):
+        return round(seconds / self.tick_timeout)
+
+    def start(self):
+        self._deadline = self._timer() + self.tick_timeout
+
+    def should_render(self):
+        """Tell if finished tick should be rendered or skipped to catch up with the schedule."""
+
+        if not self.realtime or self._timer() <= self._deadline or self._skipped_in_row >= self.max_skipped_frames:
+            self._skipped_in_row = 0
+            return True
+
+        self._skipped_in_row += 1
+        self.skipped_frames += 1
+        return False
+
+    def wait(self):
+        """Sleep until the next tick is due."""
+
+        self.tick += 1
+        if not self.realtime:
+            return
+
+        now = self._timer()
+        delay = self._deadline - now
+        if delay > 0:
+            self._sleeper(delay)
+        else:
+            self.late_ticks += 1
+
+        if -delay > self.tick_timeout * self.max_skipped_frames:
+            # too far behind to catch up, continue from now on
+            self._deadline = now + self.tick_timeout
+        else:
+            self._deadline += self.tick_timeout
+
+    def report(self):
+        return f'{self.tick} ticks, {self.late_ticks} late, {self.skipped_frames} frames skipped'
+
+
+class _TicsSleep:
+    """Awaitable, which parks the coroutine in the scheduler for a number of ticks."""
+
+    __slots__ = ('tics',)
+
+    def __init__(self, tics):
+        self.tics = tics
+
+    def __await__(self):
+        if self.tics > 0:
+            yield self
+
+
+def next_tick():
+    """Wait for the next tick, replacement of `asyncio.sleep(0)` for coroutines run by Scheduler."""
+
+    return _TicsSleep(1)
+
+
+def sleep_tics(tics):
+    return _TicsSleep(tics)
+
+
+class TimerWheel:
+    """Hashed timer wheel: items are put into the slot of their wake tick modulo wheel size.
+
+    Scheduling is O(1) and draining a tick touches only one slot. Items sleeping longer than the wheel
+    size stay in their slot for another round. `pop_due` must be called for every tick in order.
+    """
+
+    def __init__(self, size=256):
+        self._mask = size - 1
+        assert size & self._mask == 0, 'Wheel size must be a power of two'
+        self._slots = [[] for _ in range(size)]
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, wake_tick, item):
+        self._slots[wake_tick & self._mask].append((wake_tick, item))
+        self._count += 1
+
+    def pop_due(self, tick):
+        """Remove and return items due at the tick, in order they were scheduled."""
+
+        index = tick & self._mask
+        slot = self._slots[index]
+        if not slot:
+            return []
+
+        due = [item for wake_tick, item in slot if wake_tick <= tick]
+        if len(due) < len(slot):
+            self._slots[index] = [entry for entry in slot if entry[0] > tick]
+        else:
+            self._slots[index] = []
+        self._count -= len(due)
+        return due
+
+
+class Scheduler:
+    """Set of coroutines run tick by tick.
+
+    Coroutines await `next_tick()` or `sleep_tics(tics)` (plain `asyncio.sleep(0)` works as one tick too).
+    Sleeping coroutines are parked in a timer wheel by their wake tick, so they cost nothing until they are due,
+    and the cost of a tick depends on the number of coroutines resumed, not on the number of coroutines.
+    Coroutines spawned during a tick start running on the next one.
+    """
+
+    def __init__(self):
+        self.tick = 0
+        self.resumed = 0
+        self.profiler = None
+        # every time coroutine is parked its generation grows, stale entries of cancelled coroutines are skipped
+        self._tasks = {}
+        self._next = []
+        self._timers = TimerWheel()
+        self._cancelled = []
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, coroutine):
+        return coroutine in self._tasks
+
+    @property
+    def parked(self):
+        """Number of timer entries, stale entries of cancelled coroutines included."""
+
+        return len(self._timers)
+
+    def spawn(self, coroutine):
+        self._tasks[coroutine] = 0
+        self._next.append((0, coroutine))
+        return coroutine
+
+    def cancel(self, coroutine):
+        """Throw CancelledError into the coroutine at the start of the next tick."""
+
+        if coroutine in self._tasks:
+            self._cancelled.append(coroutine)
+
+    def close(self):
+        """Close all coroutines, e.g. when the game loop is stopped before they are finished."""
+
+        for coroutine in self._tasks:
+            coroutine.close()
+        self._tasks.clear()
+        self._next = []
+        self._timers = TimerWheel()
+        self._cancelled = []
+
+    def run_tick(self):
+        ready, self._next = self._next, []
+
+        step = self._step if self.profiler is None else self._profile_step
+
+        cancelled, self._cancelled = self._cancelled, []
+        for coroutine in cancelled:
+            if coroutine in self._tasks:
+                step(coroutine, asyncio.CancelledError())
+
+        ready.extend(self._timers.pop_due(self.tick))
+
+        tasks = self._tasks
+        resumed = 0
+        for generation, coroutine in ready:
+            if tasks.get(coroutine) == generation:
+                step(coroutine)
+                resumed += 1
+
+        self.resumed = resumed
+        self.tick += 1
+
+    def _profile_step(self, coroutine, exception=None):
+        started_at = time.perf_counter()
+        self._step(coroutine, exception)
+        self.profiler.add_step(coroutine.__qualname__, time.perf_counter() - started_at)
+
+    def _step(self, coroutine, exception=None):
+        try:
+            if exception is None:
+                request = coroutine.send(None)
+            else:
+                request = coroutine.throw(exception)
+        except StopIteration:
+            del self._tasks[coroutine]
+            return
+        except asyncio.CancelledError:
+            # cancelled coroutine didn't handle the error, e.g. it was cancelled before its first step
+            if exception is None:
+                raise
+            del self._tasks[coroutine]
+            return
+
+        tics = request.tics if request is not None else 1
+        generation = self._tasks[coroutine] + 1
+        self._tasks[coroutine] = generation
+        if tics == 1:
+            self._next.append((generation, coroutine))
+        else:
+            self._timers.schedule(self.tick + tics, (generation, coroutine))
@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import sys
+import time
+import traceback
+import tracemalloc
+from collections import deque
+
+import curses_tools
+from ansi import AnsiEncoder, CLEAR_SCREEN, get_border_runs, HIDE_CURSOR, RESET_ATTRS, SHOW_CURSOR
+from assets import load_assets
+from game import Game
+from game_scenario import load_scenario
+from input_events import KeyEventQueue, parse_keys
+from main import layout_windows, MIN_SCREEN_SIZE, TIC_TIMEOUT
+from profiler import percentile
+from renderer import Renderer
+from scheduler import TickClock
+
+DEFAULT_SIZE = 24, 80
+STARS_NUM = 50
+# time to wait for the terminal size from telnet client before starting the game
+NAWS_TIMEOUT = 0.5
+# session is closed this number of ticks after game over
+GAME_OVER_TICKS = 50
+# frames are not sent to slow clients while this many bytes wait in the socket buffer
+MAX_PENDING_BYTES = 64 * 1024
+STATS_INTERVAL = 10
+
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+ECHO, SUPPRESS_GO_AHEAD, NAWS = 1, 3, 31
+# character mode with server side echo (so nothing is echoed) and terminal size reports
+NEGOTIATION = bytes((IAC, WILL, ECHO, IAC, WILL, SUPPRESS_GO_AHEAD, IAC, DO, NAWS))
+CTRL_C = 3
+
+
+class TelnetParser:
+    """Strips telnet commands from the input, keeps terminal size (rows, columns) reported by NAWS."""
+
+    def __init__(self):
+        self.size = None
+        self._pending = b''
+
+    def feed(self, data):
+        """Return data without telnet commands, incomplete command is kept till the next call."""
+
+        data = self._pending + data
+        plain = bytearray()
+        position = 0
+        while position < len(data):
+            byte = data[position]
+            if byte != IAC:
+                plain.append(byte)
+                position += 1
+                continue
+            if position + 1 >= len(data):
+                break
+            command = data[position + 1]
+            if command == IAC:
+                plain.append(IAC)
+                position += 2
+            elif command in (WILL, WONT, DO, DONT):
+                if position + 2 >= len(data):
+                    break
+                position += 3
+            elif command == SB:
+                end = data.find(bytes((IAC, SE)), position)
+                if end < 0:
+                    break
+                self._subnegotiate(data[position + 2:end])
+                position = end + 2
+            else:
+                position += 2
+        self._pending = data[position:]
+        return bytes(plain)
+
+    def _subnegotiate(self, payload):
+        payload = payload.replace(bytes((IAC, IAC)), bytes((IAC,)))
+        if len(payload) == 5 and payload[0] == NAWS:
+            columns, rows = int.from_bytes(payload[1:3], 'big'), int.from_bytes(payload[3:5], 'big')
+            if rows and columns:
+                self.size = rows, columns
+
+
+class RemoteWindow:
+    """Window of a remote terminal, renderer runs are encoded and sent by the session, so drawing does nothing."""
+
+    def __init__(self, rows, columns, begin_row, begin_column):
+        self.rows, self.columns = rows, columns
+        self.begin_row, self.begin_column = begin_row, begin_column
+
+    def getmaxyx(self):
+        return self.rows, self.columns
+
+    def getbegyx(self):
+        return self.begin_row, self.begin_column
+
+    def getch(self):
+        return -1
+
+    def addstr(self, row, column, text, attr=0):
+        pass
+
+    def noutrefresh(self):
+        pass
+
+    def erase(self):
+        pass
+
+
+def fit_screen_size(rows, columns):
+    return max(rows, MIN_SCREEN_SIZE[0]), max(columns, MIN_SCREEN_SIZE[1])
+
+
+def create_windows(rows, columns):
+    """Return game and footer windows of the remote terminal."""
+
+    return layout_windows(*fit_screen_size(rows, columns), RemoteWindow)
+
+
+class Session:
+    """Game of a single connection, rendered to ANSI text instead of curses.
+
+    writer is asyncio StreamWriter. Frames are skipped while the client doesn't read them,
+    when it catches up the whole screen is sent again.
+    """
+
+    def __init__(self, writer, size, clock, stars_num=STARS_NUM, seed=None, immortal=False, scenario=None):
+        self.writer = writer
+        self.size = size
+        self.keys = KeyEventQueue()
+        self.encoder = AnsiEncoder()
+        self.closed = False
+        self.ticks = 0
+        self.skipped_frames = 0
+        self.sent_bytes = 0
+        self.tick_durations = deque(maxlen=STATS_INTERVAL * clock.seconds_to_tics(1))
+        self._key_buffer = b''
+        self._redraw = True
+        self._game_over_ticks = 0
+
+        canvas_window, sub_window = create_windows(*size)
+        self.renderers = Renderer(canvas_window), Renderer(sub_window)
+        self.game = Game(self.renderers[0].foreground, self.renderers[1].foreground, self.keys.read_controls, clock,
+                         stars_num, seed, immortal, scenario=scenario)
+
+    def feed(self, data):
+        """Handle bytes typed by the player, with telnet commands stripped."""
+
+        if CTRL_C in data:
+            self.close()
+            return
+        key_codes, self._key_buffer = parse_keys(self._key_buffer + data)
+        for key_code in key_codes:
+            self.keys.push(key_code)
+
+    def resize(self, size):
+        self.size = size
+        self.game.resize(*create_windows(*size))
+        self._redraw = True
+
+    def tick(self):
+        """Advance the game by one tick and send changes to the client."""
+
+        started_at = time.perf_counter()
+        self.game.scheduler.run_tick()
+        self.ticks += 1
+
+        if self._redraw:
+            for renderer in self.renderers:
+                renderer.invalidate()
+        runs = [(renderer.window, renderer.flush()) for renderer in self.renderers]
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            self.skipped_frames += 1
+            self._redraw = True
+        else:
+            self._send(runs)
+
+        if self.game.game_over:
+            self._game_over_ticks += 1
+        if not self.game.scheduler or self._game_over_ticks > GAME_OVER_TICKS:
+            self.close()
+        self.tick_durations.append(time.perf_counter() - started_at)
+
+    def _send(self, window_runs):
+        chunks = []
+        if self._redraw:
+            self._redraw = False
+            self.encoder.reset()
+            chunks.append(HIDE_CURSOR + RESET_ATTRS + CLEAR_SCREEN)
+            chunks.append(self.encoder.encode(get_border_runs(*fit_screen_size(*self.size))))
+        for window, runs in window_runs:
+            chunks.append(self.encoder.encode(runs, *window.getbegyx()))
+        data = ''.join(chunks).encode('utf-8')
+        if data:
+            self.writer.write(data)
+            self.sent_bytes += len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.game.scheduler.close()
+        rows, _ = self.size
+        self.writer.write(f'{RESET_ATTRS}{SHOW_CURSOR}\x1b[{rows};1H\r\n'.encode())
+        self.writer.close()
+
+
+class GameServer:
+    """Hosts game sessions of many telnet connections in one process, all ticked by one asyncio task."""
+
+    def __init__(self, stars_num=STARS_NUM, max_sessions=500, immortal=False, tick_timeout=TIC_TIMEOUT,
+                 scenario=None):
+        self.clock = TickClock(tick_timeout, realtime=False)
+        self.scenario = scenario
+        self.stars_num = stars_num
+        self.max_sessions = max_sessions
+        self.immortal = immortal
+        self.sessions = set()
+        self.late_ticks = 0
+        self._base_memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    async def handle(self, reader, writer):
+        if len(self.sessions) >= self.max_sessions:
+            writer.write(b'Server is full, try later\r\n')
+            writer.close()
+            return
+
+        telnet = TelnetParser()
+        writer.write(NEGOTIATION)
+        typed = b''
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + NAWS_TIMEOUT
+        try:
+            while telnet.size is None:
+                data = await asyncio.wait_for(reader.read(1024), max(deadline - loop.time(), 0))
+                if not data:
+                    writer.close()
+                    return
+                typed += telnet.feed(data)
+        except asyncio.TimeoutError:
+            pass
+
+        session = Session(writer, telnet.size or DEFAULT_SIZE, self.clock, self.stars_num, immortal=self.immortal,
+                          scenario=self.scenario)
+        session.feed(typed)
+        self.sessions.add(session)
+        try:
+            while not session.closed:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                size = telnet.size
+                typed = telnet.feed(data)
+                if telnet.size != size:
+                    session.resize(telnet.size)
+                session.feed(typed)
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(session)
+            session.close()
+
+    def tick(self):
+        for session in list(self.sessions):
+            try:
+                session.tick()
+            except Exception:
+                # a broken game must not take other sessions down
+                traceback.print_exc()
+                session.close()
+            if session.closed:
+                self.sessions.discard(session)
+
+    async def run_ticks(self):
+        loop = asyncio.get_running_loop()
+        next_tick_at = loop.time()
+        while True:
+            self.tick()
+            next_tick_at += self.clock.tick_timeout
+            delay = next_tick_at - loop.time()
+            if delay < 0:
+                self.late_ticks += 1
+                next_tick_at = loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+    def get_stats(self):
+        """Return CPU time of a session tick, memory per session (when traced) and traffic."""
+
+        durations = [duration for session in self.sessions for duration in session.tick_durations]
+        sessions = len(self.sessions)
+        stats = {
+            'sessions': sessions,
+            'tick_p50_us': percentile(durations, 0.5) * 1e6,
+            'tick_p99_us': percentile(durations, 0.99) * 1e6,
+            'tick_mean_us': sum(durations) / len(durations) * 1e6 if durations else 0,
+            'late_ticks': self.late_ticks,
+            'skipped_frames': sum(session.skipped_frames for session in self.sessions),
+            'sent_bytes': sum(session.sent_bytes for session in self.sessions),
+        }
+        if tracemalloc.is_tracing() and sessions:
+            stats['memory_per_session_kb'] = (tracemalloc.get_traced_memory()[0] - self._base_memory) / sessions / 1024
+        return stats
+
+    async def report_stats(self, interval=STATS_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            print(' '.join(f'{name}={value:.0f}' for name, value in self.get_stats().items()), file=sys.stderr)
+
+
+async def serve(host, port, game_server, stats=False):
+    server = await asyncio.start_server(game_server.handle, host, port)
+    print(f'Serving on {host}:{port}, connect with `telnet {host} {port}`', file=sys.stderr)
+    tasks = [asyncio.ensure_future(game_server.run_ticks())]
+    if stats:
+        tasks.append(asyncio.ensure_future(game_server.report_stats()))
+    async with server:
+        await asyncio.gather(server.serve_forever(), *tasks)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Host many games in one process, one per telnet connection')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8023, help='Port to listen on')
+    parser.add_argument('--assets-bundle', default=None,
+                        help='Load frames from bundle packed with `python3 assets.py FILE` instead of frames/')
+    parser.add_argument('--stars', type=int, default=STARS_NUM, help='Number of stars in the sky of every session')
+    parser.add_argument('--max-sessions', type=int, default=500, help='Connections over the limit are refused')
+    parser.add_argument('--immortal', action='store_true', default=False,
+                        help="Spaceships don't collide with garbage")
+    parser.add_argument('--scenario', default=None, help='Play scenario from JSON file, see scenario.json')
+    parser.add_argument('--stats', action='store_true', default=False,
+                        help=f'Print session tick timings every {STATS_INTERVAL} seconds')
+    parser.add_argument('--trace-memory', action='store_true', default=False,
+                        help='Trace memory allocations to report memory per session with --stats, slows down ticks')
+    return parser
+
+
+if __name__ == '__main__':
+    args = create_parser().parse_args()
+    # there is no curses screen to beep on
+    curses_tools.sound_enabled = False
+    if args.trace_memory:
+        tracemalloc.start()
+    # frames and compiled sprites are loaded once and shared by all sessions
+    load_assets(args.assets_bundle)
+    scenario = load_scenario(args.scenario) if args.scenario else None
+    game_server = GameServer(args.stars, args.max_sessions, args.immortal, scenario=scenario)
+    try:
+        asyncio.run(serve(args.host, args.port, game_server, args.stats))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import socket
+import struct
+import sys
+import threading
+import zlib
+from collections import deque
+
+from ansi import AnsiEncoder, CLEAR_SCREEN, get_border_runs, HIDE_CURSOR, RESET_ATTRS, SHOW_CURSOR
+from asciicast import get_screen_layout, OUTPUT, RESIZE
+from renderer import BLANK, get_runs
+
+# packet: kind, screen rows, screen columns, payload length, then payload — ANSI text drawing the changes
+PACKET_HEADER_FORMAT = '>BHHI'
+PACKET_HEADER_SIZE = struct.calcsize(PACKET_HEADER_FORMAT)
+KEYFRAME, DELTA = 1, 2
+# set in kind of packets with zlib compressed payload
+COMPRESSED = 0x80
+
+MAX_SPECTATORS = 100
+# frames are not sent to a spectator while this many bytes wait in its socket buffer
+MAX_PENDING_BYTES = 256 * 1024
+# spectator is dropped after this number of frames skipped in a row
+MAX_SKIPPED_FRAMES = 50
+# how often the feed checks for new frames; waking the feed up from the game loop would cost a syscall per frame
+POLL_INTERVAL = 0.02
+# seconds the feed waits for spectators to disconnect on close
+CLOSE_TIMEOUT = 2.0
+
+
+def pack_packet(kind, size, text, compress=False):
+    payload = text.encode('utf-8')
+    if compress:
+        payload = zlib.compress(payload)
+        kind |= COMPRESSED
+    rows, columns = size
+    return struct.pack(PACKET_HEADER_FORMAT, kind, rows, columns, len(payload)) + payload
+
+
+class Spectator:
+    def __init__(self, writer):
+        self.writer = writer
+        self.needs_keyframe = True
+        self.skipped_frames = 0
+
+
+class SpectatorFeed:
+    """Streams the screen to spectators connected to a local TCP port, watch it with `python3 spectator.py PORT`.
+
+    Has the interface of AsciicastRecorder: the game loop passes runs changed by renderers to `record`.
+    Fan-out runs in asyncio loop of a background thread, which keeps a model of the screen. A frame is encoded
+    once for all spectators: as a delta of changed runs, or as a keyframe of the whole screen for those
+    who have just joined or lagged behind. Frames are skipped for spectators whose socket buffer is full,
+    and those who don't catch up are dropped, so the game loop never waits for them.
+    """
+
+    def __init__(self, windows, port, host='127.0.0.1', compress=False, max_spectators=MAX_SPECTATORS):
+        self.compress = compress
+        self.max_spectators = max_spectators
+        self.spectators = set()
+        self._handlers = set()
+        self.frames = 0
+        self.dropped = 0
+        self.sent_bytes = 0
+        self._size, self._offsets = get_screen_layout(windows)
+        self._screens = [{} for _ in self._offsets]
+        self._encoder = AnsiEncoder()
+        # (kind, runs or layout) appended by the game loop and popped by the feed
+        self._queue = deque()
+        self._stopped = threading.Event()
+        self._ready = threading.Event()
+        self._error = None
+        # the port actually listened on, when port 0 is given
+        self.port = port
+
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(host, port),), name='spectator-feed',
+                                        daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+
+    def record(self, seconds, runs):
+        """Queue runs of a rendered frame, one list of (row, column, text, attr) per window."""
+
+        self._queue.append((OUTPUT, runs))
+
+    def resize(self, seconds, windows):
+        self._queue.append((RESIZE, get_screen_layout(windows)))
+
+    def close(self):
+        self._stopped.set()
+        # the thread is a daemon, it doesn't keep the process if it is stuck anyway
+        self._thread.join(CLOSE_TIMEOUT * 2)
+
+    async def _serve(self, host, port):
+        try:
+            server = await asyncio.start_server(self._handle, host, port)
+            self.port = server.sockets[0].getsockname()[1]
+        except OSError as error:
+            self._error = error
+            return
+        finally:
+            self._ready.set()
+
+        async with server:
+            queue = self._queue
+            while True:
+                # frames queued before close are sent too
+                stopped = self._stopped.is_set()
+                while queue:
+                    kind, data = queue.popleft()
+                    if kind == RESIZE:
+                        self._resize(data)
+                    else:
+                        self._send_frame(data)
+                if stopped:
+                    break
+                await asyncio.sleep(POLL_INTERVAL)
+            for spectator in self.spectators:
+                writer = spectator.writer
+                writer.write(pack_packet(DELTA, self._size, RESET_ATTRS + SHOW_CURSOR))
+                # closing waits for the buffer to be sent, which never happens if the spectator doesn't read
+                if writer.transport.get_write_buffer_size():
+                    writer.transport.abort()
+                else:
+                    writer.close()
+            # handlers finish when their connections are closed, otherwise they would be cancelled
+            if self._handlers:
+                _, pending = await asyncio.wait(self._handlers, timeout=CLOSE_TIMEOUT)
+                for handler in pending:
+                    handler.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _handle(self, reader, writer):
+        if len(self.spectators) >= self.max_spectators:
+            writer.close()
+            return
+        writer.transport.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        spectator = Spectator(writer)
+        self.spectators.add(spectator)
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            # spectators send nothing, wait till they disconnect
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.spectators.discard(spectator)
+            self._handlers.discard(handler)
+            writer.close()
+
+    def _resize(self, layout):
+        self._size, self._offsets = layout
+        # renderers send every cell again after resize
+        self._screens = [{} for _ in self._offsets]
+        for spectator in self.spectators:
+            spectator.needs_keyframe = True
+
+    def _send_frame(self, window_runs):
+        self.frames += 1
+        for screen, runs in zip(self._screens, window_runs):
+            for row, column, text, attr in runs:
+                for column, symbol in enumerate(text, column):
+                    cell = symbol, attr
+                    if cell == BLANK:
+                        screen.pop((row, column), None)
+                    else:
+                        screen[row, column] = cell
+
+        delta = keyframe = None
+        for spectator in list(self.spectators):
+            writer = spectator.writer
+            if writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+                spectator.skipped_frames += 1
+                spectator.needs_keyframe = True
+                if spectator.skipped_frames > MAX_SKIPPED_FRAMES:
+                    self.spectators.discard(spectator)
+                    self.dropped += 1
+                    writer.transport.abort()
+                continue
+
+            spectator.skipped_frames = 0
+            if spectator.needs_keyframe:
+                spectator.needs_keyframe = False
+                keyframe = keyframe or pack_packet(KEYFRAME, self._size, self._encode_keyframe(), self.compress)
+                packet = keyframe
+            else:
+                delta = delta or pack_packet(DELTA, self._size, self._encode_delta(window_runs), self.compress)
+                packet = delta
+            writer.write(packet)
+            self.sent_bytes += len(packet)
+
+    def _encode_delta(self, window_runs):
+        # every packet starts from unknown cursor position, so it can be applied after a skipped one
+        self._encoder.reset()
+        return ''.join(self._encoder.encode(runs, *offset) for offset, runs in zip(self._offsets, window_runs))
+
+    def _encode_keyframe(self):
+        self._encoder.reset()
+        chunks = [HIDE_CURSOR, RESET_ATTRS, CLEAR_SCREEN, self._encoder.encode(get_border_runs(*self._size))]
+        for offset, screen in zip(self._offsets, self._screens):
+            chunks.append(self._encoder.encode(get_runs(screen.items()), *offset))
+        return ''.join(chunks)
+
+
+async def watch(host, port, output=sys.stdout.buffer):
+    """Print the game streamed by SpectatorFeed."""
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            header = await reader.readexactly(PACKET_HEADER_SIZE)
+            kind, _, _, length = struct.unpack(PACKET_HEADER_FORMAT, header)
+            payload = await reader.readexactly(length)
+            if kind & COMPRESSED:
+                payload = zlib.decompress(payload)
+            output.write(payload)
+            output.flush()
+    except asyncio.IncompleteReadError:
+        pass
+    finally:
+        writer.close()
+        output.write((RESET_ATTRS + SHOW_CURSOR + '\n').encode())
+        output.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Watch the game started with --spectate PORT')
+    parser.add_argument('port', type=int, help='Port the game streams to')
+    parser.add_argument('--host', default='127.0.0.1', help='Host of the game')
+    args = parser.parse_args()
+    try:
+        asyncio.run(watch(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,107 @@
+import curses
+from array import array
+from collections import defaultdict
+
+from scheduler import next_tick
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# star brightness cycle: dim, normal, bold, normal
+PHASE_ATTRS = (curses.A_DIM, curses.A_NORMAL, curses.A_BOLD, curses.A_NORMAL)
+
+
+class Starfield:
+    """Blinking stars stored in parallel arrays and advanced all at once every tick.
+
+    For every star position, symbol, brightness phase and the tick of the next phase change are kept.
+    Only stars whose phase has changed are drawn, on the persistent layer of the renderer.
+    NumPy is used to find due stars when installed, otherwise stars are bucketed by their deadline tick.
+
+    phase_tics — duration of every phase in tics.
+    delays — number of tics every star stays in the first (dim) phase.
+    """
+
+    def __init__(self, rows, columns, symbols, delays, phase_tics, phase_attrs=PHASE_ATTRS):
+        self.phase_tics = tuple(max(tics, 1) for tics in phase_tics)
+        self.phase_attrs = tuple(phase_attrs)
+        self.symbols = ''.join(symbols)
+        self.tick = 0
+
+        if numpy is not None:
+            self.rows = numpy.array(rows, dtype=numpy.int32)
+            self.columns = numpy.array(columns, dtype=numpy.int32)
+            self.phases = numpy.zeros(len(self.symbols), dtype=numpy.int8)
+            self.deadlines = numpy.array(delays, dtype=numpy.int64)
+            self._phase_tics = numpy.array(self.phase_tics, dtype=numpy.int64)
+        else:
+            self.rows = array('i', rows)
+            self.columns = array('i', columns)
+            self.phases = array('b', bytes(len(self.symbols)))
+            self.deadlines = array('q', delays)
+            self._due = defaultdict(list)
+            for index, deadline in enumerate(self.deadlines):
+                self._due[deadline].append(index)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def draw(self, canvas):
+        """Draw every star in its current phase."""
+
+        self._draw_stars(canvas, range(len(self)))
+
+    def fit(self, old_size, new_size):
+        """Move stars from canvas of old size to canvas of new size keeping their relative positions."""
+
+        (old_rows, old_columns), (rows_number, columns_number) = old_size, new_size
+        if numpy is not None:
+            self.rows = numpy.minimum(self.rows * rows_number // old_rows, rows_number - 1).astype(numpy.int32)
+            self.columns = numpy.minimum(self.columns * columns_number // old_columns,
+                                         columns_number - 1).astype(numpy.int32)
+        else:
+            self.rows = array('i', (min(row * rows_number // old_rows, rows_number - 1) for row in self.rows))
+            self.columns = array('i', (min(column * columns_number // old_columns, columns_number - 1)
+                                       for column in self.columns))
+
+    def advance(self, canvas):
+        """Move due stars to the next phase, draw them and return the number of stars changed."""
+
+        tick = self.tick
+        self.tick += 1
+
+        if numpy is not None:
+            indices = numpy.flatnonzero(self.deadlines <= tick)
+            if not len(indices):
+                return 0
+            phases = (self.phases[indices] + 1) % len(self.phase_tics)
+            self.phases[indices] = phases
+            self.deadlines[indices] = tick + self._phase_tics[phases]
+            indices = indices.tolist()
+        else:
+            indices = self._due.pop(tick, None)
+            if not indices:
+                return 0
+            phases_number = len(self.phase_tics)
+            for index in indices:
+                phase = (self.phases[index] + 1) % phases_number
+                self.phases[index] = phase
+                deadline = tick + self.phase_tics[phase]
+                self.deadlines[index] = deadline
+                self._due[deadline].append(index)
+
+        self._draw_stars(canvas, indices)
+        return len(indices)
+
+    def _draw_stars(self, canvas, indices):
+        rows, columns, phases, symbols, attrs = self.rows, self.columns, self.phases, self.symbols, self.phase_attrs
+        for index in indices:
+            canvas.addstr(int(rows[index]), int(columns[index]), symbols[index], attrs[phases[index]])
+
+    async def animate(self, canvas):
+        self.draw(canvas)
+        while True:
+            self.advance(canvas)
+            await next_tick()